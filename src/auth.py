@@ -4,10 +4,11 @@
 
 from fastapi import APIRouter, Form, HTTPException, Depends, Response, Request
 from fastapi.responses import JSONResponse 
+from fastapi.concurrency import run_in_threadpool
 from pymongo import MongoClient
+from pymongo.errors import DuplicateKeyError
 from bson import ObjectId
 from pydantic import EmailStr
-from passlib.hash import argon2
 from typing import Union, cast
 import jwt
 import os
@@ -23,9 +24,10 @@ from qrcode.image.pil import PilImage
 from limiter import limiter
 
 from helpers_routers.helpers import get_current_user
+from helpers_routers.password_hashing import hash_password, verify_password
 from databaseConnections.mongoClient import get_collection
 
-users_collection = get_collection("store_users")
+users_collection = get_collection("store_users", use_async=True)
 # Create router
 router = APIRouter(prefix="/auth", tags=["authentication"])
 
@@ -39,10 +41,10 @@ ROLES = [role.strip() for role in os.getenv("ROLES", "").split(",") if role.stri
 UTC = timezone.utc
 
 # ==================== HELPER FUNCTIONS ====================
-def check_user_exists(userName: str, email: str):
+async def check_user_exists(userName: str, email: str):
     """Check if username or email already exists in database"""
     try:
-        user = users_collection.find_one({
+        user = await users_collection.find_one({
             "$or": [{"userName": userName}, {"email": email}]
         })
         return user is not None
@@ -52,11 +54,18 @@ def check_user_exists(userName: str, email: str):
 
     
 
-def generate_qr(user_id: str):
+def render_qr_base64(otpauth_uri: str) -> str:
+    """Render the provisioning URI as a base64 PNG (CPU-bound - run it in the threadpool)"""
+    qr_img = qrcode.make(otpauth_uri,  image_factory=PilImage)
+    buf = io.BytesIO()
+    qr_img.save(buf, format="PNG")
+    return base64.b64encode(buf.getvalue()).decode("utf-8")
+
+async def generate_qr(user_id: str):
     """
     Placeholder for future 2FA authentication implementation
     """
-    user = users_collection.find_one({"_id": ObjectId(user_id)})
+    user = await users_collection.find_one({"_id": ObjectId(user_id)})
     user_2fa_secret = user.get("2fa_secret")
     user_2fa_registered = user.get("2fa_registered", False)
 
@@ -69,7 +78,7 @@ def generate_qr(user_id: str):
 
     if not user_2fa_secret:
         user_2fa_secret = pyotp.random_base32()
-        users_collection.update_one(
+        await users_collection.update_one(
             {"_id": ObjectId(user_id)},
             {"$set": {"2fa_secret": user_2fa_secret}}
         )
@@ -80,11 +89,7 @@ def generate_qr(user_id: str):
     )
 
     # Generate QR and encode as Base64
-    qr_img = qrcode.make(otpauth_uri,  image_factory=PilImage)
-    buf = io.BytesIO()
-    qr_img.save(buf, format="PNG")
-    qr_bytes = buf.getvalue()
-    qr_base64 = base64.b64encode(qr_bytes).decode("utf-8")
+    qr_base64 = await run_in_threadpool(render_qr_base64, otpauth_uri)
 
     return {
         "success": True,
@@ -115,14 +120,14 @@ async def register_user(
     """
     try:
         # Check if username or email already exists
-        if check_user_exists(userName, email):
+        if await check_user_exists(userName, email):
             return JSONResponse(
                 content={"error": "Username or email already exists"},
                 status_code=400
             )
         
-        # Hash the password for security
-        hashed_password = argon2.hash(password)
+        # Hash the password for security (runs in the hashing pool, off the event loop)
+        hashed_password = await hash_password(password)
         
         # Create new user document
         new_user = {
@@ -138,8 +143,14 @@ async def register_user(
             "role": "customer" 
         }
         
-        # Insert into database
-        result = users_collection.insert_one(new_user)
+        # Insert into database (the unique userName/email indexes catch concurrent signups)
+        try:
+            result = await users_collection.insert_one(new_user)
+        except DuplicateKeyError:
+            return JSONResponse(
+                content={"error": "Username or email already exists"},
+                status_code=400
+            )
         
         if result.inserted_id:
             return JSONResponse(
@@ -156,6 +167,9 @@ async def register_user(
             status_code=500
         )
     
+    except HTTPException:
+        raise
+
     except Exception as error:
         print(f"❌ Registration error: {error}")
         return JSONResponse(
@@ -205,26 +219,28 @@ async def get_my_info(user = Depends(get_current_user)):
 @router.post("/login-step")
 @limiter.limit("5/minute")
 
-def login_step(request: Request, userName: str = Form(...), password: str = Form(...)):
+async def login_step(request: Request, userName: str = Form(...), password: str = Form(...)):
     try:
         print(f"🔹 Login attempt for username: {userName}")
-        user = users_collection.find_one({"userName": userName})
+        user = await users_collection.find_one({"userName": userName})
         if not user:
             print("❌ User not found")
             return JSONResponse({"error": "Invalid username or password"}, status_code=401)
         # Verify password
         try:
-            password_correct = argon2.verify(password, user.get("password", ""))
+            password_correct = await verify_password(password, user.get("password", ""))
             if not password_correct:
                 print("❌ Password incorrect")
                 return JSONResponse({"error": "Invalid username or password"}, status_code=401)
+        except HTTPException:
+            raise
         except Exception as verify_error:
             print(f"❌ Password verify error: {verify_error}")
             return JSONResponse({"error": "Invalid username or password"}, status_code=401)
 
         # Generate QR for 2FA
         try:
-            result = generate_qr(str(user["_id"]))
+            result = await generate_qr(str(user["_id"]))
             if result["success"] and not result["registered"]:
                 return JSONResponse({
                     "success": True,
@@ -243,6 +259,9 @@ def login_step(request: Request, userName: str = Form(...), password: str = Form
         except Exception as e:
             return JSONResponse({"success": False, "message": f"Error generating QR: {str(e)}"}, status_code=500)
 
+    except HTTPException:
+        raise
+
     except Exception as error:
         return JSONResponse({"error": f"Server error: {str(error)}"}, status_code=500)
 
@@ -251,14 +270,14 @@ def login_step(request: Request, userName: str = Form(...), password: str = Form
 # ==================== QR STEP ====================
 
 @router.post("/qr-step")
-def qr_step(request: Request, user_id: str = Form(...), digit_code: str = Form(...)):
+async def qr_step(request: Request, user_id: str = Form(...), digit_code: str = Form(...)):
     
     """
     QR code step for 2FA authentication
     """
     try:
 
-        user = users_collection.find_one({"_id": ObjectId(user_id)})
+        user = await users_collection.find_one({"_id": ObjectId(user_id)})
         if not user:
             return JSONResponse(
                 content={"error": "User not found"},
@@ -280,7 +299,7 @@ def qr_step(request: Request, user_id: str = Form(...), digit_code: str = Form(.
                 status_code=401
             )
         if not user.get("2fa_registered", False):
-            users_collection.update_one(
+            await users_collection.update_one(
                 {"_id": ObjectId(user_id)},
                 {"$set": {"2fa_registered": True}}
             )
@@ -6,63 +6,185 @@ Responses are cached in the browser for specified durations based on endpoint ty
 
 Cache Duration Strategy:
 - Product endpoints: 10 minutes (relatively static content)
-- Health checks: 1 minute (needs to be reasonably fresh)
+- Health checks: No caching (live pool/queue counters for monitoring)
 - Root endpoint: 5 minutes (static welcome message)
 - Auth/User endpoints: No caching (sensitive/dynamic data)
-- Payment/Order endpoints: No caching (real-time data)
+- Payment/Order endpoints (/api/...): No caching (real-time data)
 - Other GET endpoints: 2 minutes (safe default)
+
+The middleware is a plain ASGI middleware: it only rewrites the headers of the
+"http.response.start" message and never touches the body. The policy table is
+compiled once, when the middleware stack is built at startup, into a trie keyed
+by path segment, so each request costs one walk down the path's segments.
 """
 
-from fastapi import Request
-from starlette.middleware.base import BaseHTTPMiddleware
-from datetime import datetime, timezone, timedelta
-
-
-class CacheControlMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        response = await call_next(request)
-        path = request.url.path
-        
-        # Define endpoints that should NEVER be cached
-        NO_CACHE_PATTERNS = [
-            "/auth",
-            "/users",
-            "/payments",
-            "/orders",
-            "/dashboard",
-            "/profile",
-        ]
-        
-        if request.method == "GET":
-            # Check if path matches any no-cache pattern
-            should_not_cache = any(path.startswith(pattern) for pattern in NO_CACHE_PATTERNS)
-            
-            if should_not_cache:
-                # Sensitive or real-time data - never cache
-                response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
-                response.headers["Pragma"] = "no-cache"
-                response.headers["Expires"] = "0"
-            
-            elif path.startswith("/products"):
-                # Products - cache for 10 minutes
-                response.headers["Cache-Control"] = "public, max-age=600"
-                expiry_time = datetime.now(timezone.utc) + timedelta(minutes=10)
-                response.headers["Expires"] = expiry_time.strftime("%a, %d %b %Y %H:%M:%S GMT")
-            
-            elif path == "/health":
-                # Health check - cache for 1 minute
-                response.headers["Cache-Control"] = "public, max-age=60"
-            
-            elif path == "/":
-                # Root endpoint - cache for 5 minutes
-                response.headers["Cache-Control"] = "public, max-age=300"
-            
-            else:
-                # Default for other GET endpoints - cache for 2 minutes
-                response.headers["Cache-Control"] = "public, max-age=120"
-        
-        return response
+import time
+from email.utils import formatdate
+from typing import Optional
+
+
+# ==================== POLICY DEFINITIONS ====================
+class CacheRule:
+    """Cache policy for one path (or path prefix) with its headers pre-rendered"""
+
+    def __init__(self, max_age: Optional[int] = None, private: bool = False,
+                 no_store: bool = False, expires: bool = False, vary: Optional[str] = None):
+        if not no_store and (not isinstance(max_age, int) or isinstance(max_age, bool) or max_age < 0):
+            raise ValueError(f"max_age must be a non-negative int of seconds, got {max_age!r}")
+        self.max_age = max_age
+        self.private = private
+        self.no_store = no_store
+        self.expires = expires  # also send an absolute Expires header
+        self.vary = vary        # request headers that select between representations
+
+        if no_store:
+            self.headers = [
+                (b"cache-control", b"no-cache, no-store, must-revalidate"),
+                (b"pragma", b"no-cache"),
+                (b"expires", b"0"),
+            ]
+        else:
+            scope = "private" if private else "public"
+            self.headers = [(b"cache-control", f"{scope}, max-age={max_age}".encode())]
+        if vary:
+            self.headers.append((b"vary", vary.encode()))
+
+    @property
+    def public(self) -> bool:
+        """True if shared caches (CDN, server-side response cache) may store the response"""
+        return not self.no_store and not self.private
+
+    def header_items(self) -> list:
+        if not self.expires:
+            return self.headers
+        return self.headers + [(b"expires", _http_date(int(time.time()) + self.max_age))]
+
+
+NO_CACHE = CacheRule(no_store=True)
+DEFAULT_RULE = CacheRule(max_age=120)
+
+# Prefix rules match the path itself and everything below it ("/auth" -> "/auth/me")
+_prefix_policies: dict[str, CacheRule] = {
+    # Sensitive or real-time data - never cache
+    "/auth": NO_CACHE,
+    "/users": NO_CACHE,
+    "/payments": NO_CACHE,
+    "/orders": NO_CACHE,
+    "/api": NO_CACHE,          # orders, saved cards, payments
+    "/dashboard": NO_CACHE,
+    "/admin": NO_CACHE,        # runtime stats
+    "/profile": NO_CACHE,
+    # Products - cache for 10 minutes. Accept picks JSON or an NDJSON export on the
+    # same URL, so caches must keep one copy per Accept value
+    "/products": CacheRule(max_age=600, expires=True, vary="Accept"),
+}
+
+# Exact rules only match the path itself
+_exact_policies: dict[str, CacheRule] = {
+    "/health": NO_CACHE,                # Health check - live counters, monitoring must see them fresh
+    "/": CacheRule(max_age=300),        # Root endpoint - cache for 5 minutes
+}
+
+
+def set_cache_policy(path: str, max_age: Optional[int] = None, *, private: bool = False,
+                     no_store: bool = False, expires: bool = False, exact: bool = False,
+                     vary: Optional[str] = None):
+    """
+    Declare the cache policy for a route - call at import time from a router module.
+    The most specific (longest) matching path wins.
+
+    Examples:
+        set_cache_policy("/products/featured", max_age=1800)
+        set_cache_policy("/reports", no_store=True)
+        set_cache_policy("/products/search", max_age=60, exact=True)
+    """
+    rule = CacheRule(max_age=max_age, private=private, no_store=no_store, expires=expires, vary=vary)
+    (_exact_policies if exact else _prefix_policies)[path.rstrip("/") or "/"] = rule
+
+
+# ==================== COMPILED LOOKUP ====================
+class _Node:
+    __slots__ = ("children", "prefix_rule", "exact_rule")
+
+    def __init__(self):
+        self.children: dict[str, "_Node"] = {}
+        self.prefix_rule: Optional[CacheRule] = None
+        self.exact_rule: Optional[CacheRule] = None
+
+
+class CachePolicyTable:
+    """Path-segment trie built from the prefix and exact policies"""
+
+    def __init__(self, prefix_policies: dict, exact_policies: dict, default: CacheRule):
+        self.default = default
+        self.root = _Node()
+        for path, rule in prefix_policies.items():
+            self._node_for(path).prefix_rule = rule
+        for path, rule in exact_policies.items():
+            self._node_for(path).exact_rule = rule
+
+    @staticmethod
+    def _segments(path: str) -> list:
+        return [segment for segment in path.split("/") if segment]
+
+    def _node_for(self, path: str) -> _Node:
+        node = self.root
+        for segment in self._segments(path):
+            node = node.children.setdefault(segment, _Node())
+        return node
+
+    def resolve(self, path: str) -> CacheRule:
+        node = self.root
+        rule = node.prefix_rule or self.default
+        for segment in self._segments(path):
+            node = node.children.get(segment)
+            if node is None:
+                return rule
+            if node.prefix_rule is not None:
+                rule = node.prefix_rule
+        return node.exact_rule or rule
+
+
+def compile_cache_policies() -> CachePolicyTable:
+    return CachePolicyTable(_prefix_policies, _exact_policies, DEFAULT_RULE)
+
+
+_cached_date = (0, b"")
+
+def _http_date(timestamp: int) -> bytes:
+    """RFC 7231 date, formatted at most once per second"""
+    global _cached_date
+    if _cached_date[0] != timestamp:
+        _cached_date = (timestamp, formatdate(timestamp, usegmt=True).encode())
+    return _cached_date[1]
+
+
+# ==================== MIDDLEWARE ====================
+class CacheControlMiddleware:
+    def __init__(self, app):
+        self.app = app
+        # Built when Starlette assembles the middleware stack, after every router has
+        # been imported and had the chance to call set_cache_policy()
+        self.policies = compile_cache_policies()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "GET":
+            await self.app(scope, receive, send)
+            return
+
+        rule = self.policies.resolve(scope["path"])
+
+        async def send_with_cache_headers(message):
+            if message["type"] == "http.response.start":
+                extra = rule.header_items()
+                names = {name for name, _ in extra}
+                message["headers"] = [
+                    (name, value) for name, value in message.get("headers", [])
+                    if name.lower() not in names
+                ] + extra
+            await send(message)
 
+        await self.app(scope, receive, send_with_cache_headers)
 
 """
 ──────────────────────────────────────────────────────────────────────
@@ -109,26 +231,18 @@ How to Modify Cache Rules
 ──────────────────────────────────────────────────────────────────────
 
 To Disable Cache for Specific Endpoints:
-    Add the path pattern to NO_CACHE_PATTERNS list:
+    Add the path prefix to _prefix_policies with NO_CACHE, or from the router:
     
-    NO_CACHE_PATTERNS = [
-        "/auth",
-        "/users",
-        "/payments",
-        "/orders",
-        "/your-new-endpoint",  # Add here
-    ]
+    set_cache_policy("/your-new-endpoint", no_store=True)
 
 To Add Custom Cache Duration:
-    Add a new elif block with your endpoint and desired max-age:
+    Declare it from the router module (longest matching path wins):
     
-    elif path.startswith("/products/featured"):
-        response.headers["Cache-Control"] = "public, max-age=1800"  # 30 minutes
+    set_cache_policy("/products/featured", max_age=1800)  # 30 minutes
 
 To Use Private Cache (user-specific):
-    Replace "public" with "private":
     
-    response.headers["Cache-Control"] = "private, max-age=300"
+    set_cache_policy("/your-endpoint", max_age=300, private=True)
 
 Common Cache Durations (in seconds):
     30 seconds:  max-age=30
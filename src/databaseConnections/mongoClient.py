@@ -1,4 +1,4 @@
-from pymongo import MongoClient
+from pymongo import MongoClient, AsyncMongoClient
 from typing import cast
 import os
 
@@ -6,5 +6,19 @@ MONGO_URI = cast(str, os.getenv("MONGO_URI"))
 _client = MongoClient(MONGO_URI, tls=True, tlsAllowInvalidCertificates=False)
 _db = _client["kingburgerstore_db"]
 
-def get_collection(collection_name: str):
-    return _db[collection_name]
\ No newline at end of file
+# Async client for request handlers - awaiting it lets Mongo round trips overlap
+# instead of blocking the event loop. The sync client stays for threadpool code
+# (streamed exports) and scripts (mongoIndexes).
+_async_client = AsyncMongoClient(MONGO_URI, tls=True, tlsAllowInvalidCertificates=False)
+_async_db = _async_client["kingburgerstore_db"]
+
+def get_collection(collection_name: str, *, use_async: bool = False):
+    """Return a collection - pass use_async=True from async def code"""
+    if use_async:
+        return _async_db[collection_name]
+    return _db[collection_name]
+
+async def close_mongo_clients():
+    """Close both clients - called from main.py lifespan on shutdown"""
+    await _async_client.close()
+    _client.close()
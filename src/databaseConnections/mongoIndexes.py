@@ -0,0 +1,168 @@
+"""
+MONGO INDEX REGISTRY
+
+Declares the indexes the hot queries rely on and reconciles them at startup
+(ensure_mongo_indexes() is called from main.py lifespan).
+
+Also ships an explain()-based check that every registered hot query is served
+by an index. Run it against a database with:
+
+    python -m databaseConnections.mongoIndexes
+
+It exits non-zero if any hot query's winning plan contains a COLLSCAN.
+"""
+
+import logging
+import sys
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import PyMongoError
+
+from databaseConnections.mongoClient import get_collection
+
+logger = logging.getLogger(__name__)
+
+# ==================== REGISTRY ====================
+INDEXES = {
+    "products": [
+        # GET /products/category/{n} and ?category= listings, newest first (+ keyset pagination)
+        IndexModel([("category", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)],
+                   name="category_created_at"),
+        # GET /products/ unfiltered listing, newest first
+        IndexModel([("created_at", DESCENDING), ("_id", DESCENDING)], name="created_at"),
+    ],
+    "store_users": [
+        # login_step, update_user_profile, check_user_exists
+        IndexModel([("userName", ASCENDING)], name="userName_unique", unique=True),
+        # check_user_exists, save_paypal_vault_id
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+    ],
+}
+
+# (collection, description, filter, sort) - each must be answered from an index
+HOT_QUERIES = [
+    ("products", "listing by category", {"category": 1}, [("created_at", -1), ("_id", -1)]),
+    ("products", "full listing", {}, [("created_at", -1), ("_id", -1)]),
+    ("store_users", "login by userName", {"userName": "__index_check__"}, None),
+    ("store_users", "check_user_exists",
+     {"$or": [{"userName": "__index_check__"}, {"email": "__index_check__"}]}, None),
+    ("store_users", "paypal vault by email", {"email": "__index_check__"}, None),
+]
+
+
+# ==================== RECONCILIATION ====================
+def _same_index(existing: dict, model: IndexModel) -> bool:
+    spec = model.document
+    return (
+        list(existing["key"]) == list(spec["key"].items())
+        and bool(existing.get("unique", False)) == bool(spec.get("unique", False))
+    )
+
+
+def _has_duplicates(collection, model: IndexModel) -> bool:
+    """True if a unique index on these keys could not be built (a key value occurs twice)"""
+    keys = list(model.document["key"])
+    group_id = {f"k{i}": f"${key}" for i, key in enumerate(keys)}
+    pipeline = [
+        {"$group": {"_id": group_id, "n": {"$sum": 1}}},
+        {"$match": {"n": {"$gt": 1}}},
+        {"$limit": 1},
+    ]
+    return next(collection.aggregate(pipeline, allowDiskUse=True), None) is not None
+
+
+def _restore_index(collection, name: str, info: dict):
+    options = {k: v for k, v in info.items() if k not in ("key", "v", "ns")}
+    collection.create_indexes([IndexModel(list(info["key"]), name=name, **options)])
+
+
+def ensure_mongo_indexes() -> dict:
+    """
+    Create missing indexes and replace ones whose definition changed.
+    Failures (e.g. duplicate usernames blocking a unique index) are logged, not raised,
+    so a bad index never stops the API from starting. An outdated index is kept when
+    duplicate keys would block its unique replacement, and restored if the build
+    still fails - the collection never ends up with neither.
+    """
+    results = {}
+    for collection_name, models in INDEXES.items():
+        collection = get_collection(collection_name)
+        try:
+            existing = collection.index_information()
+        except PyMongoError as e:
+            logger.error(f"Could not read indexes for {collection_name}: {e}")
+            results[collection_name] = f"error: {e}"
+            continue
+
+        created = []
+        for model in models:
+            name = model.document["name"]
+            key = list(model.document["key"].items())
+            try:
+                if name in existing and _same_index(existing[name], model):
+                    continue
+
+                # An outdated definition under the same name or the same keys must go first
+                # (Mongo refuses two indexes with one name or one key pattern)
+                outdated = {
+                    other_name: other for other_name, other in existing.items()
+                    if other_name != "_id_" and (other_name == name or list(other["key"]) == key)
+                }
+                if outdated and model.document.get("unique") and _has_duplicates(collection, model):
+                    logger.error(f"Keeping {collection_name}.{', '.join(outdated)}: duplicate values "
+                                 f"block unique index {name}")
+                    created.append(f"{name} (error: duplicate keys)")
+                    continue
+
+                for other_name in outdated:
+                    collection.drop_index(other_name)
+                try:
+                    collection.create_indexes([model])
+                except PyMongoError:
+                    for other_name, other in outdated.items():
+                        _restore_index(collection, other_name, other)
+                    raise
+                created.append(name)
+            except PyMongoError as e:
+                logger.error(f"Failed to create index {collection_name}.{name}: {e}")
+                created.append(f"{name} (error: {e})")
+
+        results[collection_name] = created or "up to date"
+        logger.info(f"Mongo indexes for {collection_name}: {results[collection_name]}")
+
+    return results
+
+
+# ==================== COLLSCAN CHECK ====================
+def _has_collscan(plan) -> bool:
+    if isinstance(plan, dict):
+        if plan.get("stage") == "COLLSCAN":
+            return True
+        return any(_has_collscan(value) for value in plan.values())
+    if isinstance(plan, list):
+        return any(_has_collscan(value) for value in plan)
+    return False
+
+
+def find_collscans() -> list:
+    """Return the descriptions of registered hot queries whose winning plan scans the collection"""
+    failures = []
+    for collection_name, description, query, sort in HOT_QUERIES:
+        cursor = get_collection(collection_name).find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        winning_plan = cursor.explain().get("queryPlanner", {}).get("winningPlan", {})
+        if _has_collscan(winning_plan):
+            failures.append(f"{collection_name}: {description}")
+    return failures
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    ensure_mongo_indexes()
+    collscans = find_collscans()
+    for failure in collscans:
+        print(f"❌ COLLSCAN - {failure}")
+    if collscans:
+        sys.exit(1)
+    print("✅ All hot queries use an index")
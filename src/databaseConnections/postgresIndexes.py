@@ -0,0 +1,89 @@
+"""
+POSTGRES INDEX MIGRATION
+
+Base.metadata.create_all() only creates indexes together with a new table, so
+databases created before the indexes were declared in models.py never get them.
+ensure_pg_indexes() (called from main.py lifespan, and runnable by hand) applies
+every index declared on the order and webhook tables to an existing database:
+
+    python -m databaseConnections.postgresIndexes
+
+- pg_trgm is enabled first (the substring filter indexes need it)
+- indexes are built with CREATE INDEX CONCURRENTLY IF NOT EXISTS, so live
+  order writes and webhooks are not blocked while they build
+- an index left INVALID by an interrupted concurrent build is dropped and rebuilt
+
+On a large orders table the builds can take minutes, so main.py runs this in the
+background after startup (PG_INDEXES_ON_STARTUP=false skips it, for deployments
+that run the command above as a separate release step).
+"""
+
+import logging
+
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.schema import CreateIndex
+
+from databaseConnections import postgresqlDB
+from models import Order, OrderItem, WebhookEvent
+
+logger = logging.getLogger(__name__)
+
+MANAGED_TABLES = [Order.__table__, OrderItem.__table__, WebhookEvent.__table__]
+
+
+def _create_concurrently_sql(index) -> str:
+    ddl = str(CreateIndex(index, if_not_exists=True).compile(dialect=postgresql.dialect()))
+    # CONCURRENTLY is a per-run choice, not part of the model (create_all runs inside a transaction)
+    prefix = "CREATE UNIQUE INDEX" if index.unique else "CREATE INDEX"
+    return ddl.replace(prefix, f"{prefix} CONCURRENTLY", 1)
+
+
+def ensure_pg_indexes() -> dict:
+    """
+    Create any declared index missing from the database.
+    Failures are logged per index, not raised, so one bad index never stops startup.
+    """
+    if postgresqlDB.engine is None:
+        postgresqlDB.init_db()
+    if postgresqlDB.engine is None:
+        raise RuntimeError("Database not initialized - DATABASE_URL may be missing")
+
+    results = {}
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+    with postgresqlDB.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        try:
+            conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        except Exception as e:
+            logger.error(f"Could not enable pg_trgm (trigram indexes will fail): {e}")
+
+        invalid = set(conn.execute(text(
+            "SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+            "WHERE NOT i.indisvalid"
+        )).scalars())
+        existing = set(conn.execute(text(
+            "SELECT indexname FROM pg_indexes WHERE schemaname = current_schema()"
+        )).scalars())
+
+        for table in MANAGED_TABLES:
+            for index in sorted(table.indexes, key=lambda i: i.name):
+                try:
+                    if index.name in existing and index.name not in invalid:
+                        results[index.name] = "exists"
+                        continue
+                    if index.name in invalid:
+                        conn.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS "{index.name}"'))
+                    conn.execute(text(_create_concurrently_sql(index)))
+                    results[index.name] = "created"
+                    logger.info(f"Created index {index.name}")
+                except Exception as e:
+                    results[index.name] = f"error: {e}"
+                    logger.error(f"Failed to create index {index.name}: {e}")
+
+    return results
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    for name, outcome in ensure_pg_indexes().items():
+        print(f"{'❌' if outcome.startswith('error') else '✅'} {name}: {outcome}")
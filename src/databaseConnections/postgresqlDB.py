@@ -1,18 +1,30 @@
+import json
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
 from models import Base
+from databaseConnections.sql_instrumentation import instrument_engine
 import os
 from typing import cast, Optional
-from contextlib import contextmanager
+from contextlib import contextmanager, asynccontextmanager
 import logging
 
 logger = logging.getLogger(__name__)
 
 DATABASE_URL = cast(str, os.getenv("DATABASE_URL"))
+# Per-statement echo is for local debugging only - production timing goes through sql_instrumentation
+SQL_ECHO = os.getenv("SQL_ECHO", "false").lower() == "true"
 
 engine: Optional[object] = None
 SessionLocal: Optional[sessionmaker] = None
 
+# asyncpg-backed engine for async def handlers (orders, payments, webhooks)
+async_engine: Optional[AsyncEngine] = None
+AsyncSessionLocal: Optional[async_sessionmaker] = None
+
 def init_db():
     """Initialize database engine and create tables - called at app startup"""
     global engine, SessionLocal
@@ -27,7 +39,7 @@ def init_db():
         
         engine = create_engine(
             DATABASE_URL,
-            echo=True,
+            echo=SQL_ECHO,
             pool_pre_ping=True,       # Test connection before using it (fixes Railway drops)
             pool_recycle=300,          # Recycle connections every 5 mins (before Railway kills them)
             pool_size=5,               # Max persistent connections
@@ -41,6 +53,7 @@ def init_db():
                 "keepalives_count": 5,
             }
         )
+        instrument_engine(engine)
         SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
         
         Base.metadata.create_all(bind=engine)
@@ -67,4 +80,93 @@ def db_session():
         logger.error(f"Database session error: {e}")
         raise
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+# ==================== ASYNC ENGINE ====================
+def async_database_url(url: str):
+    """Point DATABASE_URL at the asyncpg driver (asyncpg spells libpq's sslmode as ssl)"""
+    url = make_url(url)
+    if url.drivername in ("postgres", "postgresql", "postgresql+psycopg2"):
+        url = url.set(drivername="postgresql+asyncpg")
+    if url.drivername == "postgresql+asyncpg" and "sslmode" in url.query:
+        query = dict(url.query)
+        query["ssl"] = query.pop("sslmode")
+        url = url.set(query=query)
+    return url
+
+def init_async_db():
+    """Create the async engine and session factory - called at app startup"""
+    global async_engine, AsyncSessionLocal
+
+    if async_engine is not None:
+        return  # Already initialized
+
+    if not DATABASE_URL:
+        logger.warning("DATABASE_URL not set - async database functionality will be unavailable")
+        return
+
+    try:
+        async_engine = create_async_engine(
+            async_database_url(DATABASE_URL),
+            echo=SQL_ECHO,
+            pool_pre_ping=True,       # Test connection before using it (fixes Railway drops)
+            pool_recycle=300,         # Recycle connections every 5 mins (before Railway kills them)
+            pool_size=5,              # Max persistent connections
+            max_overflow=10,          # Extra connections allowed under load
+            pool_timeout=30,          # Wait up to 30s for a connection
+            connect_args={"timeout": 10}  # asyncpg connect timeout
+        )
+        instrument_engine(async_engine.sync_engine)
+        # expire_on_commit=False: ORM objects stay readable after the session commits
+        AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+        logger.info("Async database engine initialized successfully")
+    except Exception as e:
+        logger.error(f"Failed to initialize async database engine: {e}")
+        raise
+
+async def close_async_db():
+    """Dispose of the async connection pool - called at app shutdown"""
+    global async_engine, AsyncSessionLocal
+    if async_engine is not None:
+        await async_engine.dispose()
+        async_engine = None
+        AsyncSessionLocal = None
+
+@asynccontextmanager
+async def async_db_session():
+    """Async context manager for database sessions (commit on success, rollback on error)"""
+    if async_engine is None:
+        init_async_db()
+
+    if async_engine is None:
+        raise RuntimeError("Database not initialized - DATABASE_URL may be missing")
+
+    async with AsyncSessionLocal() as db:
+        try:
+            yield db
+            await db.commit()
+        except Exception as e:
+            await db.rollback()
+            logger.error(f"Database session error: {e}")
+            raise
+
+
+# ==================== ESTIMATED COUNTS ====================
+class Explain(Executable, ClauseElement):
+    """EXPLAIN (FORMAT JSON) <statement>, keeping the statement's bound parameters"""
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+@compiles(Explain, "postgresql")
+def _compile_explain(element, compiler, **kw):
+    return "EXPLAIN (FORMAT JSON) " + compiler.process(element.statement, **kw)
+
+async def estimated_count(db, statement) -> int:
+    """Planner's row estimate for statement - no rows are read, so it stays cheap on big tables"""
+    plan = (await db.execute(Explain(statement))).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
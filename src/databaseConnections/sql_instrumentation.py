@@ -0,0 +1,181 @@
+"""
+SQL INSTRUMENTATION - Statement timing instead of per-statement echo
+
+Hooks SQLAlchemy's before_cursor_execute / after_cursor_execute events on the
+sync and async engines (instrument_engine() is called from postgresqlDB.py):
+
+- every statement is timed into a latency histogram keyed by its normalized SQL
+  (literals and bind parameters replaced with ?), see sql_stats() - served on
+  the admin-only GET /admin/stats; /health only shows sql_summary() counts
+- statements slower than SLOW_QUERY_MS are logged as one JSON line with the
+  normalized SQL, the duration and the route that issued them
+
+The route comes from SQLRouteMiddleware (registered in main.py), which keeps the
+current request's ASGI scope in a context variable.
+"""
+
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Optional
+
+from pythonjsonlogger.json import JsonFormatter
+from sqlalchemy import event
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+SQL_STATS_MAX_STATEMENTS = int(os.getenv("SQL_STATS_MAX_STATEMENTS", "500"))
+
+# Histogram bucket upper bounds in ms (the last bucket catches everything slower)
+BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+# ------------ Logger -------------------
+sql_log_handler = logging.StreamHandler(sys.stdout)
+sql_log_handler.setFormatter(JsonFormatter('%(asctime)s %(levelname)s %(message)s'))
+
+sql_logger = logging.getLogger("sql_logger")
+sql_logger.addHandler(sql_log_handler)
+sql_logger.setLevel(logging.INFO)
+sql_logger.propagate = False
+
+_current_scope: ContextVar[Optional[dict]] = ContextVar("sql_current_scope", default=None)
+
+_histograms: dict = {}  # normalized sql -> {"count", "total_ms", "max_ms", "buckets"}
+_slow_count = 0
+_lock = threading.Lock()
+
+
+# ------------------- Helpers -------------------
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PARAM_RE = re.compile(r"%\(\w+\)s|%s|\$\d+|(?<!:):\w+|\?")
+_IN_LIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACE_RE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=1024)
+def normalize_sql(statement: str) -> str:
+    """Collapse literals, placeholders and IN lists so the same query always maps to one key"""
+    sql = _STRING_RE.sub("?", statement)
+    sql = _PARAM_RE.sub("?", sql)
+    sql = _NUMBER_RE.sub("?", sql)
+    sql = _IN_LIST_RE.sub("(?...)", sql)
+    return _SPACE_RE.sub(" ", sql).strip()
+
+
+def current_route() -> str:
+    """METHOD + route template of the request being served (raw path before routing)"""
+    scope = _current_scope.get()
+    if scope is None:
+        return "-"
+    route = scope.get("route")
+    path = getattr(route, "path", None) or scope.get("path", "")
+    return f"{scope.get('method', '')} {path}".strip()
+
+
+def _record(sql: str, elapsed_ms: float):
+    global _slow_count
+    with _lock:
+        entry = _histograms.get(sql)
+        if entry is None:
+            if len(_histograms) >= SQL_STATS_MAX_STATEMENTS:
+                sql = "<other>"
+                entry = _histograms.get(sql)
+            if entry is None:
+                entry = {"count": 0, "total_ms": 0.0, "max_ms": 0.0, "buckets": [0] * (len(BUCKETS_MS) + 1)}
+                _histograms[sql] = entry
+
+        entry["count"] += 1
+        entry["total_ms"] += elapsed_ms
+        entry["max_ms"] = max(entry["max_ms"], elapsed_ms)
+        entry["buckets"][bisect_left(BUCKETS_MS, elapsed_ms)] += 1
+        if elapsed_ms >= SLOW_QUERY_MS:
+            _slow_count += 1
+
+
+# ------------------- Event hooks -------------------
+# The start time lives on the per-statement execution context: a failed statement
+# never reaches after_cursor_execute, and nothing is left behind on the pooled connection
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._sql_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "_sql_started", None)
+    if started is None:
+        return
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    sql = normalize_sql(statement)
+    _record(sql, elapsed_ms)
+
+    if elapsed_ms >= SLOW_QUERY_MS:
+        sql_logger.warning("slow_query", extra={
+            "duration_ms": round(elapsed_ms, 2),
+            "route": current_route(),
+            "sql": sql,
+            "executemany": executemany,
+        })
+
+
+def instrument_engine(engine):
+    """Attach the timing hooks to a sync Engine (pass async_engine.sync_engine for async)"""
+    if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+# ------------------- Public API -------------------
+def sql_stats(top: int = 20) -> dict:
+    """Slowest statements by total time, with their latency histograms"""
+    with _lock:
+        statements = sorted(_histograms.items(), key=lambda item: item[1]["total_ms"], reverse=True)[:top]
+        return {
+            "slow_query_ms": SLOW_QUERY_MS,
+            "slow_queries": _slow_count,
+            "bucket_bounds_ms": list(BUCKETS_MS) + ["inf"],
+            "statements": [
+                {
+                    "sql": sql,
+                    "count": entry["count"],
+                    "avg_ms": round(entry["total_ms"] / entry["count"], 2),
+                    "max_ms": round(entry["max_ms"], 2),
+                    "buckets": list(entry["buckets"]),
+                }
+                for sql, entry in statements
+            ],
+        }
+
+
+def sql_summary() -> dict:
+    """Counts only - safe to show on the public /health endpoint"""
+    with _lock:
+        return {
+            "statements_tracked": len(_histograms),
+            "queries": sum(entry["count"] for entry in _histograms.values()),
+            "slow_queries": _slow_count,
+        }
+
+
+class SQLRouteMiddleware:
+    """Pure ASGI middleware that makes the current request visible to the slow-query log"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        # The router adds "route" to this same scope dict once it matches
+        token = _current_scope.set(scope)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _current_scope.reset(token)
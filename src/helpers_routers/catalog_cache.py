@@ -0,0 +1,265 @@
+#catalog_cache.py
+"""
+PRODUCT CATALOG CACHE - Serves storefront product reads from memory
+
+The catalog only changes through the admin write endpoints in routers/products.py,
+which call cache_product() / invalidate_product() / invalidate_listings() so the
+cache never serves data older than the last write made through the API.
+The TTL is a safety net for edits made directly in MongoDB.
+"""
+
+import base64
+import json
+import os
+from datetime import datetime, timezone
+from typing import Optional
+
+from bson import ObjectId
+from bson.errors import InvalidId
+
+from databaseConnections.mongoClient import get_collection
+from helpers_routers.ttl_cache import TTLCache
+
+products_collection = get_collection("products", use_async=True)
+products_collection_sync = get_collection("products")  # streamed exports run in the threadpool
+
+PRODUCT_CACHE_TTL = int(os.getenv("PRODUCT_CACHE_TTL", "300"))     # seconds
+PRODUCT_CACHE_SIZE = int(os.getenv("PRODUCT_CACHE_SIZE", "2048"))  # entries
+LISTING_CACHE_SIZE = int(os.getenv("LISTING_CACHE_SIZE", "256"))   # entries
+
+# Fields a listing may ask for with ?fields=
+PRODUCT_FIELDS = {
+    "name", "slug", "short_description", "description", "price", "compare_at_price",
+    "currency", "brand", "sku", "category", "image_url", "images", "stock_quantity",
+    "availability_status", "specifications", "weight_kg", "is_active", "tags",
+    "meta_title", "meta_description", "created_at", "updated_at",
+}
+
+# Listings and single products live in separate caches, so seeding product
+# entries from a large catalog can never evict the listing that was just stored.
+# Keys: ("product", product_id) -> cleaned product
+_product_cache = TTLCache(maxsize=PRODUCT_CACHE_SIZE, ttl=PRODUCT_CACHE_TTL)
+# Keys: ("list", category)       -> list of cleaned products, newest first
+#       ("page", category, cursor, limit, fields) -> (products, next_cursor, last_modified)
+_listing_cache = TTLCache(maxsize=LISTING_CACHE_SIZE, ttl=PRODUCT_CACHE_TTL)
+
+
+def _utc_now() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+# Last create/update/delete made through the API (process start until the first one).
+# A delete leaves nothing behind to advance the listings' Last-Modified, so this does.
+_catalog_modified_at = _utc_now()
+
+
+# ==================== HELPER FUNCTION ====================
+def clean_product_data(product):
+    """
+    Convert MongoDB's _id (ObjectId) to a regular string 'id'
+    This makes it JSON-friendly for sending to frontend
+    """
+    if product:
+        product["id"] = str(product["_id"])  # Convert ObjectId to string
+        del product["_id"]  # Remove the old _id field
+    return product
+
+
+# ==================== READS ====================
+async def get_product_list(category: Optional[int] = None) -> list:
+    """Return all products (optionally for one category), newest first"""
+    key = ("list", category)
+    products = _listing_cache.get(key)
+    if products is not None:
+        return products
+
+    search_query = {}
+    if category is not None:
+        search_query["category"] = category
+
+    products = [
+        clean_product_data(p)
+        async for p in products_collection.find(search_query).sort("created_at", -1)
+    ]
+    _listing_cache.set(key, products)
+
+    # Seed single-product entries so detail pages opened from a listing are warm
+    # (no more than fit - seeding past maxsize would only evict the first seeds)
+    for product in products[:PRODUCT_CACHE_SIZE]:
+        _product_cache.set(("product", product["id"]), product)
+
+    return products
+
+
+# ------------------- Keyset pagination -------------------
+# Legacy products without created_at sort after every dated one (null is lowest in
+# a descending sort); their cursors carry created_at None and page on _id alone.
+def encode_cursor(created_at: Optional[datetime], product_id) -> str:
+    """Opaque cursor pointing just after (created_at, _id)"""
+    stamp = created_at.isoformat() if isinstance(created_at, datetime) else None
+    raw = json.dumps({"c": stamp, "i": str(product_id)})
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        data = json.loads(raw)
+        created_at = datetime.fromisoformat(data["c"]) if data["c"] is not None else None
+        return created_at, ObjectId(data["i"])
+    except (ValueError, KeyError, TypeError, InvalidId):
+        raise ValueError("Invalid cursor")
+
+
+def _after_cursor(created_at: Optional[datetime], last_id: ObjectId) -> dict:
+    if created_at is None:
+        return {"created_at": None, "_id": {"$lt": last_id}}
+    return {"$or": [
+        {"created_at": {"$lt": created_at}},
+        {"created_at": created_at, "_id": {"$lt": last_id}},
+        {"created_at": None},  # undated products come after every dated one
+    ]}
+
+
+def parse_fields(fields: Optional[str]) -> Optional[tuple]:
+    """Turn ?fields=name,price into a sorted tuple, rejecting unknown fields"""
+    if not fields:
+        return None
+    requested = tuple(sorted({f.strip() for f in fields.split(",") if f.strip()}))
+    unknown = set(requested) - PRODUCT_FIELDS
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    return requested or None
+
+
+async def get_product_page(category: Optional[int], limit: int, cursor: Optional[str] = None,
+                     fields: Optional[tuple] = None) -> tuple:
+    """
+    Return (products, next_cursor, last_modified) for one page, newest first.
+    Uses keyset pagination on (created_at, _id) so deep pages cost the same as
+    the first one, and a projection so listings only carry the fields they show.
+    """
+    key = ("page", category, cursor, limit, fields)
+    page = _listing_cache.get(key)
+    if page is not None:
+        return page
+
+    search_query = {}
+    if category is not None:
+        search_query["category"] = category
+
+    if cursor:
+        search_query.update(_after_cursor(*decode_cursor(cursor)))
+
+    projection = None
+    if fields:
+        # Timestamps are always needed for the next cursor and Last-Modified
+        projection = {field: 1 for field in fields}
+        projection["created_at"] = 1
+        projection["updated_at"] = 1
+
+    docs = await (
+        products_collection.find(search_query, projection)
+        .sort([("created_at", -1), ("_id", -1)])
+        .limit(limit + 1)
+        .to_list()
+    )
+
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        next_cursor = encode_cursor(docs[-1].get("created_at"), docs[-1]["_id"])
+
+    products = [clean_product_data(doc) for doc in docs]
+    page_last_modified = listing_last_modified(products)
+    if fields:
+        for product in products:
+            for stamp in ("created_at", "updated_at"):
+                if stamp not in fields:
+                    product.pop(stamp, None)
+
+    page = (products, next_cursor, page_last_modified)
+    _listing_cache.set(key, page)
+    return page
+
+
+# ------------------- Streaming export -------------------
+def iter_products(category: Optional[int] = None, fields: Optional[tuple] = None):
+    """
+    Yield cleaned products straight from the Mongo cursor, newest first.
+    Used for streamed exports - bypasses the cache so memory stays constant.
+    """
+    search_query = {}
+    if category is not None:
+        search_query["category"] = category
+
+    projection = {field: 1 for field in fields} if fields else None
+
+    cursor = (
+        products_collection_sync.find(search_query, projection)
+        .sort([("created_at", -1), ("_id", -1)])
+        .batch_size(500)
+    )
+    try:
+        for doc in cursor:
+            yield clean_product_data(doc)
+    finally:
+        cursor.close()
+
+
+async def get_product(product_id: str) -> Optional[dict]:
+    """Return one product by id, or None if it does not exist"""
+    key = ("product", product_id)
+    product = _product_cache.get(key)
+    if product is not None:
+        return product
+
+    product = await products_collection.find_one({"_id": ObjectId(product_id)})
+    if not product:
+        return None
+
+    product = clean_product_data(product)
+    _product_cache.set(key, product)
+    return product
+
+
+# ==================== WRITE-THROUGH / INVALIDATION ====================
+def invalidate_listings() -> None:
+    """Drop every cached listing and page (category membership or ordering may have changed)"""
+    global _catalog_modified_at
+    _catalog_modified_at = _utc_now()
+    _listing_cache.clear()
+
+
+def cache_product(product: dict) -> None:
+    """Store a freshly written (already cleaned) product and drop stale listings"""
+    _product_cache.set(("product", product["id"]), product)
+    invalidate_listings()
+
+
+def invalidate_product(product_id: str) -> None:
+    """Forget one product and every listing that may contain it"""
+    _product_cache.pop(("product", product_id))
+    invalidate_listings()
+
+
+def last_modified(products: list) -> Optional[datetime]:
+    """Latest created_at / updated_at across products (drives the Last-Modified header)"""
+    stamps = [
+        stamp
+        for product in products
+        for stamp in (product.get("updated_at"), product.get("created_at"))
+        if isinstance(stamp, datetime)
+    ]
+    # Mongo hands back naive UTC datetimes; drop tzinfo so mixed values compare
+    return max((s.replace(tzinfo=None) for s in stamps), default=None)
+
+
+def listing_last_modified(products: list) -> datetime:
+    """Last-Modified for a listing - also moves forward when a product is deleted"""
+    newest = last_modified(products)
+    return max(newest, _catalog_modified_at) if newest is not None else _catalog_modified_at
+
+
+def catalog_cache_stats() -> dict:
+    return {"products": _product_cache.stats(), "listings": _listing_cache.stats()}
@@ -0,0 +1,122 @@
+#exchange_rates.py
+"""
+EXCHANGE RATES - Cached rate tables for convert_currency
+
+Rate tables are cached per base currency and refreshed every
+EXCHANGE_RATE_REFRESH_SECONDS (stale-while-revalidate):
+- fresh table   -> used as is
+- stale table   -> used immediately, a refresh runs in the background
+- no table yet  -> fetched inline
+If exchangerate-api is down, conversions keep using the last known table.
+
+Set EXCHANGE_RATE_BACKGROUND_REFRESH=true to also refresh the bases listed in
+EXCHANGE_RATE_BASES on a timer (started from main.py lifespan).
+"""
+
+import asyncio
+import os
+import time
+from typing import Optional, cast
+
+from helpers_routers.http_clients import get_http_client
+from logs.loki_logger import push_to_loki
+
+EXCHANGE_RATE_KEY = cast(str, os.getenv("EXCHANGE_RATE_KEY"))
+EXCHANGE_RATE_REFRESH_SECONDS = int(os.getenv("EXCHANGE_RATE_REFRESH_SECONDS", "3600"))
+EXCHANGE_RATE_RETRY_SECONDS = int(os.getenv("EXCHANGE_RATE_RETRY_SECONDS", "60"))  # min gap between failed refreshes
+EXCHANGE_RATE_BACKGROUND_REFRESH = os.getenv("EXCHANGE_RATE_BACKGROUND_REFRESH", "false").lower() == "true"
+EXCHANGE_RATE_BASES = [b.strip() for b in os.getenv("EXCHANGE_RATE_BASES", "ZAR").split(",") if b.strip()]
+
+# base currency -> (fetched_at, {currency: rate})
+_rate_tables: dict[str, tuple[float, dict]] = {}
+_inflight: dict[str, asyncio.Task] = {}
+_last_attempt: dict[str, float] = {}
+_refresher_task: Optional[asyncio.Task] = None
+
+
+# ------------------- Fetching -------------------
+async def _fetch_rate_table(base: str) -> dict:
+    try:
+        client = get_http_client("exchange_rate")
+        response = await client.get(
+            f'https://v6.exchangerate-api.com/v6/{EXCHANGE_RATE_KEY}/latest/{base}'
+        )
+        data = response.json()
+
+        if data.get("result") == "error":
+            raise Exception(f"API error: {data.get('error-type')}")
+
+        rates = data.get("conversion_rates", {})
+        if not rates:
+            raise Exception("API returned no conversion_rates")
+
+    except Exception as e:
+        await push_to_loki("currency_converter", "rate_refresh_error", {
+            "base_currency": base,
+            "error": str(e)
+        })
+        raise
+
+    _rate_tables[base] = (time.monotonic(), rates)
+    await push_to_loki("currency_converter", "rate_refresh_success", {
+        "base_currency": base,
+        "currencies": len(rates)
+    })
+    return rates
+
+
+def _refresh(base: str) -> asyncio.Task:
+    """Start (or join) the single in-flight refresh for a base currency"""
+    task = _inflight.get(base)
+    if task is None:
+        _last_attempt[base] = time.monotonic()
+        task = asyncio.create_task(_fetch_rate_table(base))
+        _inflight[base] = task
+        task.add_done_callback(lambda t: _inflight.pop(base, None))
+        # Background refreshes may never be awaited - retrieve the error so it isn't reported as unhandled
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+    return task
+
+
+# ------------------- Public API -------------------
+async def get_rates(base: str) -> dict:
+    """Return the rate table for `base`, following the rules in the module docstring"""
+    entry = _rate_tables.get(base)
+
+    if entry is not None:
+        fetched_at, rates = entry
+        now = time.monotonic()
+        if (now - fetched_at >= EXCHANGE_RATE_REFRESH_SECONDS
+                and now - _last_attempt.get(base, 0) >= EXCHANGE_RATE_RETRY_SECONDS):
+            _refresh(base)  # serve stale, revalidate in the background
+        return rates
+
+    return await asyncio.shield(_refresh(base))
+
+
+async def _refresh_loop():
+    while True:
+        for base in EXCHANGE_RATE_BASES:
+            try:
+                await _refresh(base)
+            except Exception as e:
+                print(f"⚠️ Exchange rate refresh failed for {base}: {e}")
+        await asyncio.sleep(EXCHANGE_RATE_REFRESH_SECONDS)
+
+
+def start_rate_refresher():
+    """Start the optional background refresher - called from main.py lifespan"""
+    global _refresher_task
+    if EXCHANGE_RATE_BACKGROUND_REFRESH and _refresher_task is None:
+        _refresher_task = asyncio.create_task(_refresh_loop())
+
+
+async def stop_rate_refresher():
+    global _refresher_task
+    if _refresher_task is not None:
+        _refresher_task.cancel()
+        try:
+            await _refresher_task
+        except asyncio.CancelledError:
+            pass
+        _refresher_task = None
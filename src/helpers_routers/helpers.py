@@ -9,19 +9,25 @@ from fastapi import HTTPException
 from typing import cast
 import logging
 import sys
-import httpx
 from pythonjsonlogger.jsonlogger import JsonFormatter
 from logs.loki_logger import push_to_loki
+from helpers_routers.exchange_rates import get_rates
 
 from bson import ObjectId
 from databaseConnections.mongoClient import get_collection
-users_collection = get_collection("store_users")
+from helpers_routers.ttl_cache import TTLCache
+users_collection = get_collection("store_users", use_async=True)
 
 
 SECRET_KEY = cast(str, os.getenv("SECRET_KEY"))
 ALGORITHM = cast(str, os.getenv("ALGORITHM", "HS256"))
 APIVERVE_KEY = cast(str, os.getenv("APIVERVE_KEY"))
-EXCHANGE_RATE_KEY = cast(str, os.getenv("EXCHANGE_RATE_KEY"))
+
+# Short-lived cache of resolved users keyed by (user_id, token), so a burst of
+# authenticated calls from one session costs a single Mongo read
+USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", "30"))      # seconds
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "1024"))  # entries
+_user_cache = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
 
 # ------------------- Helper: Generate Merchant Reference -------------------
 def generate_merchant_reference():
@@ -30,7 +36,7 @@ def generate_merchant_reference():
     return f"PAY-{timestamp}-{suffix}"
 
 
-def get_current_user(request: Request):
+async def get_current_user(request: Request):
     token = request.cookies.get("access_token")
 
     if not token:
@@ -44,11 +50,28 @@ def get_current_user(request: Request):
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
-    user = users_collection.find_one({"_id": ObjectId(user_id)})
-    if not user:
-        raise HTTPException(status_code=401, detail="User no longer exists")
+    cache_key = (str(user_id), token)
+    user = _user_cache.get(cache_key)
+    if user is None:
+        user = await users_collection.find_one({"_id": ObjectId(user_id)})
+        if not user:
+            raise HTTPException(status_code=401, detail="User no longer exists")
+        _user_cache.set(cache_key, user)
+
+    # Shallow copy so a handler can't alter the cached document
+    return dict(user)
 
-    return user
+# ------------------- Helper: User Cache Invalidation -------------------
+def invalidate_user_cache(user_id=None, email: str = None):
+    """
+    Drop cached user documents after a write to store_users.
+    Call with the user's id, or with their email when only that is known.
+    """
+    if user_id is not None:
+        user_id = str(user_id)
+        _user_cache.discard_where(lambda key, _: key[0] == user_id)
+    if email is not None:
+        _user_cache.discard_where(lambda _, user: user.get("email") == email)
 
 def require_role(*allowed_roles: str):
     """
@@ -58,7 +81,7 @@ def require_role(*allowed_roles: str):
         Depends(require_role("admin"))
         Depends(require_role("admin", "developer"))
     """
-    def role_checker(current_user = Depends(get_current_user)):
+    async def role_checker(current_user = Depends(get_current_user)):
         user_role = current_user.get("role")
         if user_role not in allowed_roles:
             raise HTTPException(
@@ -73,37 +96,15 @@ def billing_info_helper(current_user: dict) -> dict:
         return current_user.get("billing_info", {}).get("billing_address", {})
 
 # ------------------- Helper: Currency Converter API -------------------
-#
+# Rate tables are cached in helpers_routers/exchange_rates.py - a conversion is
+# normally just a lookup and a multiply, and refreshes are logged there
 async def convert_currency(amount: float, from_currency: str, to_currency: str) -> float:
     """Convert amount from one currency to another"""
     try:
+        rates = await get_rates(from_currency)
+        converted_amount = amount * rates.get(to_currency, 1)
 
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f'https://v6.exchangerate-api.com/v6/{EXCHANGE_RATE_KEY}/latest/{from_currency}'
-            )
-            data = response.json()
-
-            if data.get("result") == "error":
-                await push_to_loki("currency_converter", "conversion_error", {
-                    "from_currency": from_currency,
-                    "to_currency": to_currency,
-                    "amount": amount,
-                    "error": data.get('error-type')
-                })
-                raise Exception(f"API error: {data.get('error-type')}")
-
-            rates = data.get("conversion_rates", {})
-            converted_amount = amount * rates.get(to_currency, 1)
-
-            await push_to_loki("currency_converter", "conversion_success", {
-                "from_currency": from_currency,
-                "to_currency": to_currency,
-                "original_amount": amount,
-                "converted_amount": converted_amount
-            })
-            
-            return round(converted_amount, 2)
+        return round(converted_amount, 2)
             
     except Exception as e:
         await push_to_loki("currency_converter", "conversion_error", {
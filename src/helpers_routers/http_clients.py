@@ -0,0 +1,79 @@
+#http_clients.py
+"""
+OUTBOUND HTTP CLIENTS - One pooled httpx.AsyncClient per upstream
+
+Creating an AsyncClient per call throws away the connection after every request,
+so each payment, log line and currency lookup paid a fresh TCP + TLS handshake.
+Clients are created once in main.py's lifespan (init_http_clients) and closed on
+shutdown (close_http_clients). Each upstream gets its own keep-alive pool, timeouts
+and connection limits, and HTTP/2 when the `h2` package is installed.
+"""
+
+import httpx
+
+try:
+    import h2  # noqa: F401  (installed by httpx[http2])
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# ------------------- Per-upstream settings -------------------
+UPSTREAMS = {
+    # Callpay card / EFT / tokenization API
+    "callpay": {
+        "timeout": httpx.Timeout(30.0, connect=5.0),
+        "limits": httpx.Limits(max_connections=20, max_keepalive_connections=10, keepalive_expiry=60),
+    },
+    # PayPal OAuth + Orders API
+    "paypal": {
+        "timeout": httpx.Timeout(30.0, connect=5.0),
+        "limits": httpx.Limits(max_connections=20, max_keepalive_connections=10, keepalive_expiry=60),
+    },
+    # Grafana Loki log push - short timeouts, logging must never hold up a request
+    "loki": {
+        "timeout": httpx.Timeout(5.0, connect=2.0),
+        "limits": httpx.Limits(max_connections=5, max_keepalive_connections=5, keepalive_expiry=120),
+    },
+    # exchangerate-api.com
+    "exchange_rate": {
+        "timeout": httpx.Timeout(10.0, connect=3.0),
+        "limits": httpx.Limits(max_connections=5, max_keepalive_connections=2, keepalive_expiry=60),
+    },
+}
+
+_clients: dict[str, httpx.AsyncClient] = {}
+
+
+def _build_client(name: str) -> httpx.AsyncClient:
+    settings = UPSTREAMS[name]
+    return httpx.AsyncClient(
+        http2=HTTP2_AVAILABLE,
+        timeout=settings["timeout"],
+        limits=settings["limits"],
+    )
+
+
+def init_http_clients():
+    """Create a client for every upstream - called from main.py lifespan"""
+    for name in UPSTREAMS:
+        if name not in _clients:
+            _clients[name] = _build_client(name)
+
+
+async def close_http_clients():
+    """Close every client and its pooled connections - called on shutdown"""
+    clients = list(_clients.values())
+    _clients.clear()
+    for client in clients:
+        await client.aclose()
+
+
+def get_http_client(name: str) -> httpx.AsyncClient:
+    """
+    Return the shared client for an upstream ("callpay", "paypal", "loki", "exchange_rate").
+    Created on first use if the lifespan hasn't run (e.g. scripts, tests).
+    """
+    client = _clients.get(name)
+    if client is None or client.is_closed:
+        client = _clients[name] = _build_client(name)
+    return client
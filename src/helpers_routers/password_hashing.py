@@ -0,0 +1,158 @@
+#password_hashing.py
+"""
+PASSWORD HASHING - Runs argon2 hash/verify off the event loop
+
+argon2 is deliberately slow and memory hungry. Calling it inline from an async
+handler freezes the single uvicorn worker for every other request, so all
+password hashing and verification goes through a small process pool instead.
+
+The number of calls waiting on the pool is capped (HASH_MAX_PENDING); once the
+cap is reached new calls are rejected with a 503 rather than queueing forever.
+
+If a worker process dies (OOM kill, segfault) the whole pool is broken; it is
+replaced with a fresh one and the call is retried once.
+"""
+
+import asyncio
+import math
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+from fastapi import HTTPException
+from passlib.hash import argon2
+
+
+def _cgroup_cpu_limit() -> Optional[int]:
+    """CPUs granted to the container by its cgroup quota (os.cpu_count() reports the host's)"""
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:             # cgroup v2: "<quota> <period>"
+            quota, period = f.read().split()[:2]
+        if quota == "max":
+            return None
+        return max(1, math.ceil(int(quota) / int(period)))
+    except (OSError, ValueError):
+        pass
+    try:
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:   # cgroup v1
+            quota = int(f.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+            period = int(f.read())
+        return max(1, math.ceil(quota / period)) if quota > 0 else None
+    except (OSError, ValueError):
+        return None
+
+
+# Each argon2 call also holds ~64MB, so without a quota stay at a small fixed pool
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(_cgroup_cpu_limit() or 2)))
+HASH_MAX_PENDING = int(os.getenv("HASH_MAX_PENDING", str(HASH_WORKERS * 8)))
+
+_executor: Optional[ProcessPoolExecutor] = None
+_pending = 0  # only touched from the event loop thread
+
+_stats = {
+    "completed": 0,
+    "failed": 0,
+    "rejected": 0,
+    "peak_pending": 0,
+    "pool_restarts": 0,
+    "total_seconds": 0.0,
+}
+
+
+# ------------------- Worker functions (run in the pool) -------------------
+def _hash(password: str) -> str:
+    return argon2.hash(password)
+
+
+def _verify(password: str, hashed: str) -> bool:
+    return argon2.verify(password, hashed)
+
+
+# ------------------- Pool lifecycle -------------------
+def start_hashing_pool():
+    """Create the process pool - called from main.py lifespan"""
+    global _executor
+    if _executor is None:
+        # "spawn" so workers don't inherit the parent's Mongo/Postgres sockets
+        _executor = ProcessPoolExecutor(
+            max_workers=HASH_WORKERS,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+
+
+def _replace_broken_pool(broken: ProcessPoolExecutor):
+    """Swap in a new pool - only once, however many calls saw the same broken one"""
+    global _executor
+    if _executor is broken:
+        _stats["pool_restarts"] += 1
+        print("⚠️ Password hashing pool broken (worker died) - restarting it")
+        broken.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+        start_hashing_pool()
+
+
+def shutdown_hashing_pool():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True, cancel_futures=True)
+        _executor = None
+
+
+async def _run_in_pool(fn, *args):
+    global _pending
+
+    if _pending >= HASH_MAX_PENDING:
+        _stats["rejected"] += 1
+        raise HTTPException(status_code=503, detail="Server busy, please try again shortly")
+
+    if _executor is None:
+        start_hashing_pool()
+
+    _pending += 1
+    _stats["peak_pending"] = max(_stats["peak_pending"], _pending)
+    started = time.perf_counter()
+    try:
+        executor = _executor
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+        except BrokenProcessPool:
+            _replace_broken_pool(executor)
+            result = await asyncio.get_running_loop().run_in_executor(_executor, fn, *args)
+        _stats["completed"] += 1
+        return result
+    except Exception:
+        _stats["failed"] += 1
+        raise
+    finally:
+        _pending -= 1
+        _stats["total_seconds"] += time.perf_counter() - started
+
+
+# ------------------- Public API -------------------
+async def hash_password(password: str) -> str:
+    """Hash a password with argon2 in the hashing pool"""
+    return await _run_in_pool(_hash, password)
+
+
+async def verify_password(password: str, hashed: str) -> bool:
+    """Verify a password against an argon2 hash in the hashing pool"""
+    return await _run_in_pool(_verify, password, hashed)
+
+
+def hashing_stats() -> dict:
+    finished = _stats["completed"] + _stats["failed"]
+    return {
+        "workers": HASH_WORKERS,
+        "max_pending": HASH_MAX_PENDING,
+        "pending": _pending,
+        "peak_pending": _stats["peak_pending"],
+        "completed": _stats["completed"],
+        "failed": _stats["failed"],
+        "rejected": _stats["rejected"],
+        "pool_restarts": _stats["pool_restarts"],
+        "avg_ms": round(_stats["total_seconds"] / finished * 1000, 2) if finished else 0.0,
+    }
@@ -0,0 +1,81 @@
+#paypal_token.py
+"""
+Caches the PayPal client-credentials token until shortly before it expires.
+
+Concurrent callers share one in-flight refresh (single-flight), so a burst of
+checkouts after expiry still makes a single OAuth round trip to PayPal.
+"""
+
+import asyncio
+import time
+from typing import Optional
+
+from jose import jwt
+
+from helpers_routers.http_clients import get_http_client
+
+
+class PayPalTokenManager:
+    def __init__(self, token_url: str, username: str, password: str, refresh_margin: int = 120):
+        self.token_url = token_url
+        self.username = username
+        self.password = password
+        self.refresh_margin = refresh_margin  # seconds before expiry to refresh
+
+        self._data: Optional[dict] = None
+        self._expires_at = 0.0
+        self._inflight: Optional[asyncio.Task] = None
+
+    def _is_fresh(self) -> bool:
+        return self._data is not None and time.monotonic() < self._expires_at - self.refresh_margin
+
+    async def _fetch(self) -> dict:
+        payload = {
+            "grant_type": "client_credentials",
+            "response_type": "id_token"
+        }
+        client = get_http_client("paypal")
+        response = await client.post(
+            self.token_url,
+            data=payload,
+            auth=(self.username, self.password)
+        )
+        response.raise_for_status()
+        data = response.json()
+        if "id_token" not in data:
+            raise Exception(f"PayPal token response missing id_token: {data}")
+
+        lifetime = float(data.get("expires_in", 0))
+
+        # The id_token can expire before the access token - honour whichever ends first
+        try:
+            claims = jwt.get_unverified_claims(data["id_token"])
+            if claims.get("exp"):
+                lifetime = min(lifetime or float("inf"), claims["exp"] - time.time())
+        except Exception:
+            pass
+
+        self._data = data
+        self._expires_at = time.monotonic() + max(lifetime, 0)
+        return data
+
+    async def get_token_data(self, force_refresh: bool = False) -> dict:
+        """Return the cached token response, refreshing it if expired or forced"""
+        if not force_refresh and self._is_fresh():
+            return self._data
+
+        if self._inflight is None:
+            self._inflight = asyncio.create_task(self._fetch())
+            self._inflight.add_done_callback(lambda _: setattr(self, "_inflight", None))
+
+        # shield: one caller being cancelled must not cancel the shared refresh
+        return await asyncio.shield(self._inflight)
+
+    async def get_token(self, force_refresh: bool = False) -> str:
+        data = await self.get_token_data(force_refresh)
+        return data["id_token"]
+
+    def invalidate(self):
+        """Forget the cached token (e.g. after PayPal answered 401)"""
+        self._data = None
+        self._expires_at = 0.0
@@ -0,0 +1,162 @@
+#product_search.py
+"""
+PRODUCT SEARCH - Ranked text search with filters and facets for GET /products/search
+
+Search runs against an in-memory inverted index built from the catalog cache's
+full product list (get_product_list()). Whenever a product write invalidates the
+cached list, the next search sees a new list object and rebuilds the index, so
+results follow the catalog without a separate invalidation hook.
+
+Scoring: each query term adds weight x occurrences for every field it appears in
+(name 5, tags 3, brand 3, short_description 2, description 1). All terms must
+match; the last term also matches as a prefix so "intel cor" finds "core".
+"""
+
+import re
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from typing import Optional
+
+from helpers_routers.catalog_cache import get_product_list
+
+FIELD_WEIGHTS = {
+    "name": 5,
+    "tags": 3,
+    "brand": 3,
+    "short_description": 2,
+    "description": 1,
+}
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> list:
+    return _TOKEN_RE.findall(text.lower())
+
+
+class SearchIndex:
+    def __init__(self, products: list):
+        self.products = products
+        self.postings: dict = defaultdict(dict)  # term -> {product position: score}
+
+        for position, product in enumerate(products):
+            for field, weight in FIELD_WEIGHTS.items():
+                value = product.get(field)
+                if not value:
+                    continue
+                text = " ".join(value) if isinstance(value, list) else str(value)
+                for term, count in Counter(tokenize(text)).items():
+                    postings = self.postings[term]
+                    postings[position] = postings.get(position, 0) + weight * count
+
+        self.vocabulary = sorted(self.postings)
+
+    def _prefix_postings(self, prefix: str) -> dict:
+        """Merge the postings of every term starting with prefix (best score per product)"""
+        merged: dict = {}
+        start = bisect_left(self.vocabulary, prefix)
+        for term in self.vocabulary[start:]:
+            if not term.startswith(prefix):
+                break
+            for position, score in self.postings[term].items():
+                if score > merged.get(position, 0):
+                    merged[position] = score
+        return merged
+
+    def match(self, query: str) -> list:
+        """Return [(position, score)] for products matching every query term, best first"""
+        terms = tokenize(query)
+        if not terms:
+            return [(position, 0) for position in range(len(self.products))]
+
+        scores: Optional[dict] = None
+        for i, term in enumerate(terms):
+            is_last = i == len(terms) - 1
+            postings = self._prefix_postings(term) if is_last else self.postings.get(term, {})
+            if scores is None:
+                scores = dict(postings)
+            else:
+                scores = {p: s + postings[p] for p, s in scores.items() if p in postings}
+            if not scores:
+                return []
+
+        # Ties keep catalog order (newest first)
+        return sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+
+
+_index: Optional[SearchIndex] = None
+
+
+async def get_search_index() -> SearchIndex:
+    """Return the index for the current catalog list, rebuilding it if the list changed"""
+    global _index
+    products = await get_product_list(None)
+    if _index is None or _index.products is not products:
+        _index = SearchIndex(products)
+    return _index
+
+
+# ------------------- Filters & facets -------------------
+def _lower_set(values: Optional[list]) -> set:
+    return {v.strip().lower() for v in values or [] if v and v.strip()}
+
+
+def _matches_filters(product: dict, category, min_price, max_price, availability, brands, tags) -> bool:
+    if category is not None and product.get("category") != category:
+        return False
+    price = product.get("price")
+    if min_price is not None and (price is None or price < min_price):
+        return False
+    if max_price is not None and (price is None or price > max_price):
+        return False
+    if availability and (product.get("availability_status") or "").lower() not in availability:
+        return False
+    if brands and (product.get("brand") or "").lower() not in brands:
+        return False
+    if tags and not tags <= {t.lower() for t in product.get("tags") or []}:
+        return False
+    return True
+
+
+def _facets(products: list) -> dict:
+    brand, availability, tags, category = Counter(), Counter(), Counter(), Counter()
+    for product in products:
+        if product.get("brand"):
+            brand[product["brand"]] += 1
+        if product.get("availability_status"):
+            availability[product["availability_status"]] += 1
+        if product.get("category") is not None:
+            category[str(product["category"])] += 1
+        tags.update(set(product.get("tags") or []))
+
+    return {
+        "brand": dict(brand.most_common()),
+        "availability_status": dict(availability.most_common()),
+        "tags": dict(tags.most_common()),
+        "category": dict(category.most_common()),
+    }
+
+
+async def search_products(query: str = "", *, category: Optional[int] = None,
+                          min_price: Optional[float] = None, max_price: Optional[float] = None,
+                          availability_status: Optional[list] = None, brands: Optional[list] = None,
+                          tags: Optional[list] = None, limit: int = 24, offset: int = 0) -> dict:
+    """
+    Rank, filter and paginate the catalog.
+    Facet counts cover every product matching the query and filters, not just the returned page.
+    """
+    index = await get_search_index()
+    availability, brand_set, tag_set = _lower_set(availability_status), _lower_set(brands), _lower_set(tags)
+
+    hits = [
+        (index.products[position], score)
+        for position, score in index.match(query)
+        if _matches_filters(index.products[position], category, min_price, max_price,
+                            availability, brand_set, tag_set)
+    ]
+
+    return {
+        "total": len(hits),
+        "products": [{**product, "score": score} for product, score in hits[offset:offset + limit]],
+        "facets": _facets([product for product, _ in hits]),
+    }
@@ -0,0 +1,79 @@
+#streaming.py
+"""
+Streaming responses for large exports (full catalog, full order history).
+
+Rows are encoded and written as they come off the Mongo cursor / SQLAlchemy
+result, so memory stays flat no matter how many documents are exported.
+Both sync iterators and async iterators (AsyncSession.stream) are accepted.
+
+Selected by the client with:
+- Accept: application/x-ndjson  -> one JSON document per line
+- ?stream=1                      -> a streamed JSON array (NDJSON if Accept asks for it)
+
+The representation depends on Accept, so streamed responses carry Vary: Accept
+(the /products cache rule adds it to the buffered JSON responses too).
+"""
+
+import json
+from typing import AsyncIterable, Iterable, Optional, Union
+
+from fastapi import Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+
+NDJSON = "application/x-ndjson"
+
+
+def stream_mode(request: Request, stream: bool = False) -> Optional[str]:
+    """Return "ndjson", "json" or None (normal buffered response)"""
+    if NDJSON in request.headers.get("accept", ""):
+        return "ndjson"
+    if stream:
+        return "json"
+    return None
+
+
+def _encode(row) -> str:
+    return json.dumps(jsonable_encoder(row), separators=(",", ":"))
+
+
+def _ndjson_lines(rows: Iterable[dict]):
+    for row in rows:
+        yield _encode(row) + "\n"
+
+
+def _json_array(rows: Iterable[dict]):
+    yield "["
+    first = True
+    for row in rows:
+        yield ("" if first else ",") + _encode(row)
+        first = False
+    yield "]"
+
+
+async def _ndjson_lines_async(rows: AsyncIterable[dict]):
+    async for row in rows:
+        yield _encode(row) + "\n"
+
+
+async def _json_array_async(rows: AsyncIterable[dict]):
+    yield "["
+    first = True
+    async for row in rows:
+        yield ("" if first else ",") + _encode(row)
+        first = False
+    yield "]"
+
+
+def streaming_json_response(rows: Union[Iterable[dict], AsyncIterable[dict]], mode: str) -> StreamingResponse:
+    """
+    Wrap a row iterator in a StreamingResponse.
+    Starlette pulls sync iterators in its threadpool, so blocking cursors are fine;
+    async iterators are consumed on the event loop.
+    """
+    if hasattr(rows, "__aiter__"):
+        body = _ndjson_lines_async(rows) if mode == "ndjson" else _json_array_async(rows)
+    else:
+        body = _ndjson_lines(rows) if mode == "ndjson" else _json_array(rows)
+    media_type = NDJSON if mode == "ndjson" else "application/json"
+    return StreamingResponse(body, media_type=media_type, headers={"Vary": "Accept"})
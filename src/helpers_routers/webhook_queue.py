@@ -0,0 +1,238 @@
+#webhook_queue.py
+"""
+WEBHOOK QUEUE - Durable inbox for payment provider webhooks
+
+The webhook endpoints only append the raw event to the webhook_events table
+(enqueue_event) and answer 200 straight away. A pool of WEBHOOK_WORKERS
+background workers (started from main.py lifespan) then claims and processes
+events with the handler registered for their provider (register_handler).
+
+- Claiming uses SELECT ... FOR UPDATE SKIP LOCKED, so workers never process the
+  same event twice; the row lock is held until the event is finished.
+- Events sharing an ordering_key (merchant_reference / paypal_order_id) run one
+  at a time, in arrival order: an event waits while an earlier event with the
+  same key is still pending (including one waiting for a retry).
+- A handler that raises is retried with exponential backoff (capped at
+  WEBHOOK_MAX_BACKOFF) up to WEBHOOK_MAX_ATTEMPTS, then marked failed.
+  A handler that raises PermanentWebhookError (retrying cannot help, e.g. an
+  unmapped provider status) is marked failed at once.
+- Failed events keep their payload and last_error; replay_failed_events()
+  puts them back in the queue once the cause is fixed.
+- Events left pending by a crash are simply picked up again on the next run.
+
+Deduplication: providers redeliver notifications, so enqueue_event takes the
+provider's event id (PayPal event id, Callpay transaction id + status).
+Recently seen ids are answered from a bounded in-memory set without any query;
+older ones are caught by the unique (provider, event_id) index, which rejects
+the INSERT with an IntegrityError. Either way the duplicate is never queued,
+so it never reaches the orders table. A plain INSERT (not ON CONFLICT, which
+needs the index to exist) keeps webhooks accepted on a database where the index
+has not been built yet - only the database-side dedup is missing until then.
+"""
+
+import asyncio
+import os
+from datetime import timedelta
+from typing import Awaitable, Callable, Optional
+
+from sqlalchemy import exists, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import aliased
+
+from databaseConnections.postgresqlDB import async_db_session
+from helpers_routers.ttl_cache import TTLCache
+from models import WebhookEvent, utc_now
+
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "4"))
+WEBHOOK_MAX_ATTEMPTS = int(os.getenv("WEBHOOK_MAX_ATTEMPTS", "8"))
+WEBHOOK_MAX_BACKOFF = float(os.getenv("WEBHOOK_MAX_BACKOFF", "900"))     # seconds
+WEBHOOK_POLL_INTERVAL = float(os.getenv("WEBHOOK_POLL_INTERVAL", "5"))   # seconds (idle / due retries)
+WEBHOOK_DEDUP_SIZE = int(os.getenv("WEBHOOK_DEDUP_SIZE", "10000"))       # event ids kept in memory
+WEBHOOK_DEDUP_TTL = int(os.getenv("WEBHOOK_DEDUP_TTL", "86400"))         # seconds
+
+Handler = Callable[[dict, Optional[str]], Awaitable[None]]  # (payload, origin_ip)
+
+_handlers: dict[str, Handler] = {}
+_workers: list[asyncio.Task] = []
+_wakeup: Optional[asyncio.Event] = None
+
+# (provider, event_id) -> True for events already stored
+_seen_events = TTLCache(maxsize=WEBHOOK_DEDUP_SIZE, ttl=WEBHOOK_DEDUP_TTL)
+
+_stats = {"enqueued": 0, "duplicates": 0, "processed": 0, "retried": 0, "failed": 0}
+
+
+class PermanentWebhookError(Exception):
+    """Raised by a handler for an event that retrying cannot fix - it is marked failed at once"""
+
+
+# ------------------- Registry -------------------
+def register_handler(provider: str, handler: Handler):
+    """Register the coroutine that processes events of one provider"""
+    _handlers[provider] = handler
+
+
+# ------------------- Producer -------------------
+async def enqueue_event(provider: str, payload: dict, *, event_id: str = None, event_type: str = None,
+                        ordering_key: str = None, origin_ip: str = None) -> Optional[int]:
+    """
+    Durably store a received webhook and wake a worker.
+    Returns the queue row id, or None if this provider event_id was already stored.
+    """
+    dedup_key = (provider, event_id)
+    if event_id and _seen_events.get(dedup_key):
+        _stats["duplicates"] += 1
+        return None
+
+    try:
+        async with async_db_session() as db:
+            row_id = await db.scalar(
+                insert(WebhookEvent)
+                .values(
+                    provider=provider,
+                    event_id=event_id,
+                    event_type=event_type,
+                    ordering_key=ordering_key,
+                    payload=payload,
+                    origin_ip=origin_ip
+                )
+                .returning(WebhookEvent.id)
+            )
+    except IntegrityError:
+        if not event_id:
+            raise
+        row_id = None  # unique (provider, event_id) - already stored
+
+    if event_id:
+        _seen_events.set(dedup_key, True)
+    if row_id is None:
+        _stats["duplicates"] += 1
+        return None
+
+    _stats["enqueued"] += 1
+    if _wakeup is not None:
+        _wakeup.set()
+    return row_id
+
+
+# ------------------- Worker -------------------
+def _backoff(attempts: int) -> float:
+    return min(2 ** attempts, WEBHOOK_MAX_BACKOFF)
+
+
+def _claim_statement():
+    earlier = aliased(WebhookEvent)
+    return (
+        select(WebhookEvent)
+        .where(
+            WebhookEvent.status == "pending",
+            WebhookEvent.next_attempt_at <= utc_now(),
+            ~exists().where(
+                earlier.ordering_key == WebhookEvent.ordering_key,
+                earlier.id < WebhookEvent.id,
+                earlier.status == "pending"
+            )
+        )
+        .order_by(WebhookEvent.id)
+        .limit(1)
+        .with_for_update(skip_locked=True, of=WebhookEvent)
+    )
+
+
+async def process_next_event() -> bool:
+    """Claim and process one due event. Returns False when nothing was due."""
+    async with async_db_session() as db:
+        event = await db.scalar(_claim_statement())
+        if event is None:
+            return False
+
+        handler = _handlers.get(event.provider)
+        event.attempts += 1
+        try:
+            if handler is None:
+                raise RuntimeError(f"No webhook handler registered for provider '{event.provider}'")
+            await handler(event.payload, event.origin_ip)
+        except Exception as e:
+            event.last_error = str(e)[:2000]
+            if isinstance(e, PermanentWebhookError) or event.attempts >= WEBHOOK_MAX_ATTEMPTS:
+                event.status = "failed"
+                _stats["failed"] += 1
+                print(f"❌ Webhook event {event.id} failed after {event.attempts} attempts: {e}")
+            else:
+                event.next_attempt_at = utc_now() + timedelta(seconds=_backoff(event.attempts))
+                _stats["retried"] += 1
+        else:
+            event.status = "done"
+            event.processed_at = utc_now()
+            event.last_error = None
+            _stats["processed"] += 1
+
+    return True
+
+
+async def replay_failed_events(provider: str = None, event_ids: list = None) -> int:
+    """Queue failed events again (all, one provider's, or the given ids). Returns how many."""
+    stmt = (
+        update(WebhookEvent)
+        .where(WebhookEvent.status == "failed")
+        .values(status="pending", attempts=0, next_attempt_at=utc_now())
+        .returning(WebhookEvent.id)
+    )
+    if provider:
+        stmt = stmt.where(WebhookEvent.provider == provider)
+    if event_ids:
+        stmt = stmt.where(WebhookEvent.id.in_(event_ids))
+
+    async with async_db_session() as db:
+        replayed = len((await db.scalars(stmt)).all())
+
+    if replayed and _wakeup is not None:
+        _wakeup.set()
+    return replayed
+
+
+async def _worker_loop():
+    while True:
+        try:
+            if await process_next_event():
+                continue
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"⚠️ Webhook worker error: {e}")
+
+        # Idle: wait for a new event, or poll for retries that have become due
+        try:
+            await asyncio.wait_for(_wakeup.wait(), WEBHOOK_POLL_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        _wakeup.clear()
+
+
+def start_webhook_workers():
+    """Start the worker pool - called from main.py lifespan"""
+    global _wakeup
+    if _workers:
+        return
+    _wakeup = asyncio.Event()
+    _wakeup.set()  # drain anything left over from before a restart
+    for _ in range(WEBHOOK_WORKERS):
+        _workers.append(asyncio.create_task(_worker_loop()))
+
+
+async def stop_webhook_workers():
+    """Cancel the workers - unfinished events stay pending and are resumed on the next start"""
+    global _wakeup
+    for task in _workers:
+        task.cancel()
+    for task in _workers:
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+    _workers.clear()
+    _wakeup = None
+
+
+def webhook_queue_stats() -> dict:
+    return {**_stats, "workers": len(_workers), "dedup_cache": _seen_events.stats()}
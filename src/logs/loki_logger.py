@@ -0,0 +1,196 @@
+"""
+LOKI LOGGER - Background, batched log shipping to Grafana Loki
+
+push_to_loki() only puts the entry on an in-memory queue, so request latency no
+longer includes a Loki round trip. A single background worker (started from
+main.py lifespan) drains the queue, groups entries into one stream per
+(service, event_type) and posts a gzip-compressed batch when either
+LOKI_BATCH_SIZE entries are waiting or LOKI_FLUSH_INTERVAL seconds have passed.
+
+If Loki is down (5xx, 429 or a network error) the worker retries the current
+batch with backoff, at most LOKI_MAX_RETRIES times. A batch Loki rejects outright
+(any other 4xx - bad credentials, out-of-order or oversized entries) would never
+succeed, so it is dropped straight away and counted in dropped_batches. The queue
+is bounded (LOKI_QUEUE_SIZE); when it is full the oldest entry is dropped to make room.
+Whatever is left is flushed on shutdown.
+"""
+
+import asyncio
+import gzip
+import time
+import json
+import os
+from typing import cast, Optional
+
+import httpx
+
+from helpers_routers.http_clients import get_http_client
+
+LOKI_URL = cast(str, os.getenv("LOKI_URL"))
+LOKI_USER = cast(str, os.getenv("LOKI_USER"))
+LOKI_KEY = cast(str, os.getenv("LOKI_KEY"))
+
+LOKI_BATCH_SIZE = int(os.getenv("LOKI_BATCH_SIZE", "500"))
+LOKI_FLUSH_INTERVAL = float(os.getenv("LOKI_FLUSH_INTERVAL", "2"))      # seconds
+LOKI_QUEUE_SIZE = int(os.getenv("LOKI_QUEUE_SIZE", "10000"))
+LOKI_MAX_BACKOFF = float(os.getenv("LOKI_MAX_BACKOFF", "60"))          # seconds
+LOKI_MAX_RETRIES = int(os.getenv("LOKI_MAX_RETRIES", "5"))             # per batch
+LOKI_SHUTDOWN_TIMEOUT = float(os.getenv("LOKI_SHUTDOWN_TIMEOUT", "5"))  # seconds
+
+# Entry = (service, event_type, timestamp_ns, line)
+_queue: Optional[asyncio.Queue] = None
+_worker: Optional[asyncio.Task] = None
+_batch: list = []  # entries taken off the queue but not yet accepted by Loki
+
+_stats = {"sent": 0, "dropped": 0, "failed_batches": 0, "dropped_batches": 0}
+
+
+# ------------------- Helpers -------------------
+def _build_body(entries: list) -> bytes:
+    """Group entries into one stream per (service, event_type) and gzip the push body"""
+    streams: dict = {}
+    for service, event_type, ts, line in entries:
+        streams.setdefault((service, event_type), []).append([ts, line])
+
+    body = {
+        "streams": [
+            {"stream": {"service": service, "event_type": event_type}, "values": values}
+            for (service, event_type), values in streams.items()
+        ]
+    }
+    return gzip.compress(json.dumps(body).encode("utf-8"))
+
+
+async def _send(entries: list):
+    client = get_http_client("loki")
+    response = await client.post(
+        LOKI_URL,
+        content=_build_body(entries),
+        headers={"Content-Type": "application/json", "Content-Encoding": "gzip"},
+        auth=(LOKI_USER, LOKI_KEY)
+    )
+    response.raise_for_status()
+    _stats["sent"] += len(entries)
+
+
+def _is_permanent(error: Exception) -> bool:
+    """4xx other than 429 - resending the same batch can never succeed"""
+    if not isinstance(error, httpx.HTTPStatusError):
+        return False
+    status = error.response.status_code
+    return 400 <= status < 500 and status != 429
+
+
+def _drop_batch(reason: str):
+    _stats["dropped_batches"] += 1
+    _stats["dropped"] += len(_batch)
+    print(f"Dropped Loki batch of {len(_batch)} entries: {reason}")
+    _batch.clear()
+
+
+def _enqueue(entry: tuple):
+    """Put an entry on the queue, dropping the oldest one if it is full"""
+    if _queue.full():
+        try:
+            _queue.get_nowait()
+            _stats["dropped"] += 1
+        except asyncio.QueueEmpty:
+            pass
+    _queue.put_nowait(entry)
+
+
+# ------------------- Public API -------------------
+async def push_to_loki(service: str, event_type: str, payload: dict):
+    """Queue a log line for Loki (shipped in the background)"""
+    entry = (service, event_type, str(time.time_ns()), json.dumps(payload, default=str))
+
+    if _queue is None:
+        # Shipper not running (e.g. scripts) - send this entry directly
+        try:
+            await _send([entry])
+        except Exception as e:
+            print(f"Failed to push to Loki: {e}")
+        return
+
+    _enqueue(entry)
+
+
+def loki_stats() -> dict:
+    return {**_stats, "queued": _queue.qsize() if _queue else 0, "in_batch": len(_batch)}
+
+
+# ------------------- Background worker -------------------
+async def _ship_loop():
+    loop = asyncio.get_running_loop()
+    backoff = 1.0
+    retries = 0
+
+    while True:
+        if not _batch:
+            _batch.append(await _queue.get())
+
+        # Collect until the batch is full or the flush interval has passed
+        deadline = loop.time() + LOKI_FLUSH_INTERVAL
+        while len(_batch) < LOKI_BATCH_SIZE:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                _batch.append(await asyncio.wait_for(_queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        try:
+            await _send(_batch)
+            _batch.clear()
+            backoff, retries = 1.0, 0
+        except Exception as e:
+            _stats["failed_batches"] += 1
+            if _is_permanent(e):
+                _drop_batch(f"rejected by Loki: {e}")
+                backoff, retries = 1.0, 0
+                continue
+            if retries >= LOKI_MAX_RETRIES:
+                _drop_batch(f"giving up after {retries} retries: {e}")
+                # keep the backoff - Loki is still unreachable for the next batch
+                retries = 0
+                continue
+            retries += 1
+            print(f"Failed to push to Loki ({len(_batch)} entries, retrying in {backoff:.0f}s): {e}")
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, LOKI_MAX_BACKOFF)
+
+
+def start_loki_shipper():
+    """Create the queue and start the worker - called from main.py lifespan"""
+    global _queue, _worker
+    if _worker is None:
+        _queue = asyncio.Queue(maxsize=LOKI_QUEUE_SIZE)
+        _worker = asyncio.create_task(_ship_loop())
+
+
+async def stop_loki_shipper():
+    """Stop the worker and flush whatever is still queued - called on shutdown"""
+    global _queue, _worker
+    if _worker is None:
+        return
+
+    _worker.cancel()
+    try:
+        await _worker
+    except asyncio.CancelledError:
+        pass
+
+    remaining = list(_batch)
+    while not _queue.empty():
+        remaining.append(_queue.get_nowait())
+    _batch.clear()
+    _queue = None
+    _worker = None
+
+    for start in range(0, len(remaining), LOKI_BATCH_SIZE):
+        try:
+            await asyncio.wait_for(_send(remaining[start:start + LOKI_BATCH_SIZE]), LOKI_SHUTDOWN_TIMEOUT)
+        except Exception as e:
+            print(f"Failed to flush Loki logs on shutdown: {e}")
+            break
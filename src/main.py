@@ -10,9 +10,11 @@ interactions. (Notably in postgresqlDB.py, models.py, helpers.py & auth.py)
 
 import sys
 import os
+import asyncio
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Depends
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
 from contextlib import asynccontextmanager
 
 from slowapi import _rate_limit_exceeded_handler
@@ -25,6 +27,7 @@ import logging
 logging.basicConfig(level=logging.INFO)
 
 from cache_middleware import CacheControlMiddleware
+from response_cache import ResponseCacheMiddleware, response_cache_stats
 from auth import router as auth_router
 from routers.users import router as users_router
 from routers.products import router as products_router
@@ -35,7 +38,31 @@ from routers.password_generator import router as password_generator_router
 from payment_routers.payment import router as payment_router
 from payment_routers.paypal_router import router as paypal_router
 
-from databaseConnections.postgresqlDB import init_db
+from databaseConnections.sql_instrumentation import SQLRouteMiddleware, sql_summary, sql_stats
+from databaseConnections.postgresqlDB import init_db, init_async_db, close_async_db
+from databaseConnections.postgresIndexes import ensure_pg_indexes
+from databaseConnections.mongoIndexes import ensure_mongo_indexes
+from databaseConnections.mongoClient import close_mongo_clients
+from helpers_routers.password_hashing import start_hashing_pool, shutdown_hashing_pool, hashing_stats
+from helpers_routers.http_clients import init_http_clients, close_http_clients
+from helpers_routers.exchange_rates import start_rate_refresher, stop_rate_refresher
+from helpers_routers.webhook_queue import start_webhook_workers, stop_webhook_workers, webhook_queue_stats
+from logs.loki_logger import start_loki_shipper, stop_loki_shipper, loki_stats
+from helpers_routers.catalog_cache import catalog_cache_stats
+from helpers_routers.helpers import require_role
+
+# CREATE INDEX CONCURRENTLY on a large table can outlast gunicorn's worker timeout,
+# so the migration runs after startup instead of blocking it
+PG_INDEXES_ON_STARTUP = os.getenv("PG_INDEXES_ON_STARTUP", "true").lower() == "true"
+
+
+async def apply_pg_indexes():
+    try:
+        await run_in_threadpool(ensure_pg_indexes)
+        print("✅ Postgres indexes applied")
+    except Exception as e:
+        print(f"⚠️ Postgres index migration failed (non-blocking): {e}")
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -45,14 +72,40 @@ async def lifespan(app: FastAPI):
     """
     try:
         init_db()
+        init_async_db()
         print("✅ Database initialized successfully")
     except Exception as e:
         print(f"⚠️ Database init failed (non-blocking): {e}")
+    try:
+        await run_in_threadpool(ensure_mongo_indexes)
+        print("✅ Mongo indexes reconciled")
+    except Exception as e:
+        print(f"⚠️ Mongo index reconciliation failed (non-blocking): {e}")
+    start_hashing_pool()
+    print("✅ Password hashing pool started")
+    init_http_clients()
+    print("✅ Outbound HTTP clients ready")
+    start_loki_shipper()
+    print("✅ Loki log shipper started")
+    start_rate_refresher()
+    start_webhook_workers()
+    print("✅ Webhook queue workers started")
+    pg_index_task = asyncio.create_task(apply_pg_indexes()) if PG_INDEXES_ON_STARTUP else None
     print("🚀 Starting application...")
     print(f"🐍 Python version: {sys.version}")
     print(f"🔒 OpenSSL version: {ssl.OPENSSL_VERSION}")
     yield
     print("👋 Shutting down application...")
+    if pg_index_task is not None and not pg_index_task.done():
+        # The build thread cannot be interrupted; an INVALID leftover is rebuilt next start
+        pg_index_task.cancel()
+    await stop_rate_refresher()
+    await stop_webhook_workers()
+    shutdown_hashing_pool()
+    await stop_loki_shipper()
+    await close_http_clients()
+    await close_mongo_clients()
+    await close_async_db()
 
 
 app = FastAPI(
@@ -70,6 +123,10 @@ print("✅ FastAPI app initialized")
 app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
+# Innermost middleware: cached responses still get fresh CORS and Cache-Control headers
+app.add_middleware(ResponseCacheMiddleware)
+print("✅ Response cache middleware configured")
+
 allowed_origins = [
     "https://kingburger.site",
     "https://api.kingburger.site",
@@ -92,6 +149,10 @@ print("✅ CORS middleware configured")
 app.add_middleware(CacheControlMiddleware)
 print("✅ Cache Control middleware configured")
 
+# Tags SQL timings / slow-query logs with the route that issued them
+app.add_middleware(SQLRouteMiddleware)
+print("✅ SQL route middleware configured")
+
 
 @app.get("/")
 def root():
@@ -108,7 +169,23 @@ def health_check():
     """Health check endpoint for monitoring."""
     return {
         "status": "healthy",
-        "service": "kingburger's-store-api"
+        "service": "kingburger's-store-api",
+        "password_hashing": hashing_stats(),
+        "sql": sql_summary(),
+        "webhook_queue": webhook_queue_stats()
+    }
+
+
+@app.get("/admin/stats")
+def admin_stats(current_user = Depends(require_role("admin", "developer"))):
+    """Detailed runtime stats (SQL latency histograms, caches, log shipping) - admin only."""
+    return {
+        "sql": sql_stats(),
+        "catalog_cache": catalog_cache_stats(),
+        "response_cache": response_cache_stats(),
+        "loki": loki_stats(),
+        "password_hashing": hashing_stats(),
+        "webhook_queue": webhook_queue_stats()
     }
 
 # Router Registration
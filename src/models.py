@@ -1,9 +1,17 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Index, Text, event, text
 from sqlalchemy.orm import declarative_base, relationship
 from datetime import datetime, timezone
 from sqlalchemy.dialects.postgresql import JSON
 Base = declarative_base()
 
+def utc_now() -> datetime:
+    """Naive UTC timestamp for the order columns (timestamp without time zone)"""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+def _pg_trgm_available(ddl, target, bind, **kw) -> bool:
+    """create_all() only builds the trigram indexes if _enable_pg_trgm succeeded"""
+    return bind is None or bind.info.get("pg_trgm", False)
+
 from pydantic import BaseModel
 from typing import Optional, List, Dict
 from pydantic import HttpUrl
@@ -68,24 +76,79 @@ class Order(Base):
     payment_type = Column(String(50), nullable=False)
     delivery_info = Column(JSON, nullable=True)
     status = Column(String(50), default="pending")
-    created_at = Column(DateTime, default=datetime.now(timezone.utc))
-    updated_at = Column(DateTime, default=datetime.now(timezone.utc), onupdate=datetime.now(timezone.utc))
+    created_at = Column(DateTime, default=utc_now)  # callable - evaluated per insert, not at import
+    updated_at = Column(DateTime, default=utc_now, onupdate=utc_now)
     reason = Column(String(255), nullable=True)
-    paypal_order_id = Column(String(255), nullable=True)
+    paypal_order_id = Column(String(255), nullable=True, index=True)  # PayPal webhook lookups
     items = relationship("OrderItem", back_populates="order", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        # Order history: WHERE user_id = ? ORDER BY created_at DESC, id DESC (+ keyset cursor / date range)
+        Index("ix_orders_user_id_created_at", "user_id", created_at.desc(), id.desc()),
+        # Substring filters (ilike '%...%') - trigram GIN indexes need the pg_trgm extension
+        Index("ix_orders_status_trgm", "status",
+              postgresql_using="gin", postgresql_ops={"status": "gin_trgm_ops"}).ddl_if(callable_=_pg_trgm_available),
+        Index("ix_orders_payment_type_trgm", "payment_type",
+              postgresql_using="gin", postgresql_ops={"payment_type": "gin_trgm_ops"}).ddl_if(callable_=_pg_trgm_available),
+        Index("ix_orders_merchant_reference_trgm", "merchant_reference",
+              postgresql_using="gin", postgresql_ops={"merchant_reference": "gin_trgm_ops"}).ddl_if(callable_=_pg_trgm_available),
+    )
+
 
 class OrderItem(Base):
     __tablename__ = "order_items"
 
     id = Column(Integer, primary_key=True, index=True)
-    order_id = Column(Integer, ForeignKey("orders.id"))
+    order_id = Column(Integer, ForeignKey("orders.id"), index=True)  # selectinload(Order.items)
     name = Column(String(255), nullable=False)
     price = Column(Float, nullable=False)
     quantity = Column(Integer, nullable=False)
 
     order = relationship("Order", back_populates="items")
 
+
+class WebhookEvent(Base):
+    """Durable inbox of received payment webhooks - processed by helpers_routers/webhook_queue.py"""
+    __tablename__ = "webhook_events"
+
+    id = Column(Integer, primary_key=True)
+    provider = Column(String(20), nullable=False)        # callpay | paypal
+    event_id = Column(String(255), nullable=True)        # provider's id for the delivery (dedup key)
+    event_type = Column(String(100), nullable=True)
+    ordering_key = Column(String(255), nullable=True)    # merchant_reference / paypal_order_id
+    payload = Column(JSON, nullable=False)
+    origin_ip = Column(String(64), nullable=True)
+    status = Column(String(20), nullable=False, default="pending")  # pending | done | failed
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False, default=utc_now)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=utc_now)
+    processed_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        # Worker claim: WHERE status = 'pending' AND next_attempt_at <= now ORDER BY id
+        Index("ix_webhook_events_status_next_attempt", "status", "next_attempt_at"),
+        # Per-key ordering check: earlier unfinished events with the same key
+        Index("ix_webhook_events_ordering_key", "ordering_key", "id"),
+        # Dedup of redelivered notifications (INSERT ... ON CONFLICT DO NOTHING)
+        Index("ux_webhook_events_provider_event_id", "provider", "event_id", unique=True),
+    )
+
+# create_all() on a fresh database needs pg_trgm before the trigram indexes.
+# A role without extension rights only loses those indexes (ensure_pg_indexes
+# logs the same failure) - table creation itself must not fail.
+@event.listens_for(Base.metadata, "before_create")
+def _enable_pg_trgm(target, connection, **kw):
+    if connection.dialect.name != "postgresql":
+        return
+    try:
+        with connection.begin_nested():
+            connection.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        connection.info["pg_trgm"] = True
+    except Exception as e:
+        connection.info["pg_trgm"] = False
+        print(f"⚠️ Could not enable pg_trgm, trigram indexes skipped: {e}")
+
 # --------------- Payment Body Models --------------------
 class EFTPaymentRequest(BaseModel):
     amount: float
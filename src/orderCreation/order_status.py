@@ -0,0 +1,97 @@
+#order_status.py
+"""
+ORDER STATUS TRANSITIONS - One conditional UPDATE per payment event
+
+    pending -> approved -> completed
+                        -> failed
+    (pending may also go straight to completed / failed)
+
+transition_order() applies a status change as a single
+UPDATE orders ... WHERE <key> = :key AND status IN (<allowed from>) RETURNING id,
+so the legal-transition check and the write are atomic: a late or out-of-order
+webhook (e.g. an "approved" arriving after "completed") matches no row and
+cannot move an order backwards.
+"""
+
+from typing import Optional
+
+from sqlalchemy import select, update
+
+from models import Order, utc_now
+
+# target status -> statuses it may be reached from
+ORDER_TRANSITIONS = {
+    "approved": ("pending",),
+    "completed": ("pending", "approved"),
+    "failed": ("pending", "approved"),
+}
+
+# Callpay postback status -> order status. Only the values Callpay documents for a
+# transaction: "complete", "failed", "cancelled" and the in-progress "pending" /
+# "processing" (None - nothing to change yet).
+CALLPAY_STATUS_MAP = {
+    "complete": "completed",
+    "failed": "failed",
+    "cancelled": "failed",
+    "pending": None,
+    "processing": None,
+}
+
+# Every Callpay postback also carries the boolean "success" flag (see payment.py)
+_CALLPAY_SUCCESS = {"1": "completed", "true": "completed", "0": "failed", "false": "failed"}
+
+
+class UnknownPaymentStatus(ValueError):
+    """A provider status this module has no mapping for"""
+
+
+def callpay_order_status(payload: dict) -> Optional[str]:
+    """
+    Order status a Callpay postback moves the order to, or None while the payment is
+    still in progress. Raises UnknownPaymentStatus if neither the status nor the
+    success flag can be interpreted, so the event is kept for inspection instead of dropped.
+    """
+    status = str(payload.get("status") or "").strip().lower()
+    if status in CALLPAY_STATUS_MAP:
+        return CALLPAY_STATUS_MAP[status]
+
+    success = str(payload.get("success") or "").strip().lower()
+    if success in _CALLPAY_SUCCESS:
+        return _CALLPAY_SUCCESS[success]
+
+    raise UnknownPaymentStatus(f"Unmapped Callpay status={payload.get('status')!r} success={payload.get('success')!r}")
+
+
+async def transition_order(db, status: str, reason: str = None, *,
+                           merchant_reference: str = None, paypal_order_id: str = None,
+                           allowed_from: tuple = None) -> str:
+    """
+    Move the order identified by merchant_reference or paypal_order_id to status.
+    allowed_from overrides ORDER_TRANSITIONS for exceptional moves (e.g. a refund of a completed order).
+    Returns "order_updated", "transition_rejected", "order_not_found" or "invalid_reference".
+    The change is committed by the caller's session (async_db_session()).
+    """
+    if status not in ORDER_TRANSITIONS:
+        raise ValueError(f"Unknown order status: {status}")
+    allowed_from = allowed_from or ORDER_TRANSITIONS[status]
+
+    if merchant_reference:
+        key_column, key = Order.merchant_reference, merchant_reference
+    elif paypal_order_id:
+        key_column, key = Order.paypal_order_id, paypal_order_id
+    else:
+        return "invalid_reference"
+
+    order_id = await db.scalar(
+        update(Order)
+        .where(key_column == key, Order.status.in_(allowed_from))
+        .values(status=status, reason=reason[:255] if reason else reason, updated_at=utc_now())
+        .returning(Order.id)
+        .execution_options(synchronize_session=False)
+    )
+    if order_id is not None:
+        return "order_updated"
+
+    # Nothing matched - only now look up why (the normal path stays one statement)
+    exists = await db.scalar(select(Order.id).where(key_column == key).limit(1))
+    return "transition_rejected" if exists is not None else "order_not_found"
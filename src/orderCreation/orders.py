@@ -1,11 +1,17 @@
 from fastapi import APIRouter, Request, HTTPException, Depends, Query
 from fastapi.responses import JSONResponse
 from models import Order, OrderItem
-from sqlalchemy.orm import joinedload
-from datetime import datetime
+from sqlalchemy import select, insert, func, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import selectinload
+from datetime import datetime, timezone
+import base64
+import json
 import os
-from databaseConnections.postgresqlDB import db_session
+from databaseConnections.postgresqlDB import async_db_session, estimated_count
 from helpers_routers.helpers import get_current_user
+from helpers_routers.streaming import stream_mode, streaming_json_response
+from helpers_routers.ttl_cache import TTLCache
 from databaseConnections.mongoClient import get_collection
 from bson import ObjectId
 
@@ -13,14 +19,84 @@ from bson import ObjectId
 router = APIRouter(prefix="/api", tags=["orders"])
 
 # --- Collections ---
-products_collection = get_collection("products")
+products_collection = get_collection("products", use_async=True)
+
+# --- Idempotency ---
+# Responses of created orders, so a retried checkout is answered without repricing.
+# Keys: ("ref", merchant_reference) and ("key", user_id, Idempotency-Key) -> (user_id, response body)
+# The body is stored without "status" - webhooks change it after creation, so a
+# replay reads the current status from the row.
+ORDER_IDEMPOTENCY_TTL = int(os.getenv("ORDER_IDEMPOTENCY_TTL", "86400"))  # seconds
+ORDER_IDEMPOTENCY_SIZE = int(os.getenv("ORDER_IDEMPOTENCY_SIZE", "4096"))  # entries
+_order_responses = TTLCache(maxsize=ORDER_IDEMPOTENCY_SIZE, ttl=ORDER_IDEMPOTENCY_TTL)
+
+
+def order_response(merchant_reference: str, total: float, status: str) -> dict:
+    return {
+        "success": True,
+        "merchant_reference": merchant_reference,
+        "calculated_amount": f"{total:.2f}",
+        "status": status
+    }
+
+
+def replay_order(user_id: str, owner_id: str, body: dict) -> JSONResponse:
+    """Answer a duplicate submission with the original order (409 if it belongs to someone else)."""
+    if owner_id != user_id:
+        raise HTTPException(status_code=409, detail="merchant_reference is already in use")
+    return JSONResponse(body, headers={"Idempotent-Replayed": "true"})
+
+
+def remember_order(user_id: str, idempotency_key, body: dict):
+    body = {k: v for k, v in body.items() if k != "status"}
+    _order_responses.set(("ref", body["merchant_reference"]), (user_id, body))
+    if idempotency_key:
+        _order_responses.set(("key", user_id, idempotency_key), (user_id, body))
+
+
+async def replay_cached_order(user_id: str, owner_id: str, body: dict) -> JSONResponse:
+    """Replay a remembered order with its current status (one indexed lookup, replays only)."""
+    if owner_id != user_id:
+        return replay_order(user_id, owner_id, body)
+    try:
+        async with async_db_session() as db:
+            status = await db.scalar(
+                select(Order.status).where(Order.merchant_reference == body["merchant_reference"])
+            )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Order creation failed: {str(e)}")
+    return replay_order(user_id, owner_id, {**body, "status": status})
+
+
+async def find_existing_order(db, merchant_reference: str):
+    """Return (owner_id, response body) for an order already stored under merchant_reference."""
+    row = (await db.execute(
+        select(Order.user_id, Order.total, Order.status)
+        .where(Order.merchant_reference == merchant_reference)
+    )).first()
+    if row is None:
+        return None
+    return row.user_id, order_response(merchant_reference, row.total, row.status)
 
 
 # --- Create Order ---
 @router.post("/orders/create-order")
 async def create_order(request: Request, current_user=Depends(get_current_user)):
-    """Create a new order from cart data."""
+    """
+    Create a new order from cart data.
+
+    Idempotent on merchant_reference (and on the optional Idempotency-Key header):
+    submitting the same order again returns the original response without
+    repricing, marked with an Idempotent-Replayed header.
+    """
     user_id = str(current_user["_id"])
+    idempotency_key = request.headers.get("idempotency-key")
+
+    # ── Replay from memory before doing any work ──
+    if idempotency_key:
+        cached = _order_responses.get(("key", user_id, idempotency_key))
+        if cached is not None:
+            return await replay_cached_order(user_id, *cached)
 
     data = await request.json()
     items = data.get("items", [])
@@ -28,6 +104,25 @@ async def create_order(request: Request, current_user=Depends(get_current_user))
     delivery_info = data.get("delivery_info", {})
     merchant_reference = data.get("merchant_reference")
 
+    if not merchant_reference:
+        raise HTTPException(status_code=400, detail="merchant_reference is required")
+
+    cached = _order_responses.get(("ref", merchant_reference))
+    if cached is not None:
+        return await replay_cached_order(user_id, *cached)
+
+    # ── An explicit retry that missed memory (e.g. after a restart): check the database
+    # before repricing. Other duplicates are caught by ON CONFLICT below. ──
+    if idempotency_key:
+        try:
+            async with async_db_session() as db:
+                existing = await find_existing_order(db, merchant_reference)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Order creation failed: {str(e)}")
+        if existing is not None:
+            remember_order(existing[0], idempotency_key if existing[0] == user_id else None, existing[1])
+            return replay_order(user_id, *existing)
+
     if not items:
         raise HTTPException(status_code=400, detail="No items provided for order")
     if not delivery_info:
@@ -57,16 +152,30 @@ async def create_order(request: Request, current_user=Depends(get_current_user))
         "country": verified_address.get("country")
     }
 
-    # ── Look up real prices from MongoDB ──
-    total = 0
-    validated_items = []
-
+    # ── Look up real prices from MongoDB (one query for the whole cart) ──
+    product_ids = []
     for item in items:
         try:
-            product = products_collection.find_one({"_id": ObjectId(item["id"])})
+            product_ids.append(ObjectId(item["id"]))
         except Exception:
+            product_ids.append(None)
+
+    products_by_id = {
+        p["_id"]: p
+        async for p in products_collection.find(
+            {"_id": {"$in": [pid for pid in product_ids if pid is not None]}},
+            {"name": 1, "price": 1}
+        )
+    }
+
+    total = 0
+    validated_items = []
+
+    for item, product_id in zip(items, product_ids):
+        if product_id is None:
             raise HTTPException(status_code=400, detail=f"Invalid product ID: {item.get('id')}")
 
+        product = products_by_id.get(product_id)
         if not product:
             raise HTTPException(status_code=400, detail=f"Product not found: {item.get('id')}")
 
@@ -82,41 +191,127 @@ async def create_order(request: Request, current_user=Depends(get_current_user))
             "quantity": quantity
         })
 
-    # ── Write to PostgreSQL ──
+    # ── Write to PostgreSQL (two statements, whatever the cart size) ──
     try:
-        with db_session() as db:
-            new_order = Order(
-                merchant_reference=merchant_reference,
-                user_id=user_id,
-                total=round(total, 2),
-                payment_type=payment_type,
-                delivery_info=verified_delivery_info
-            )
-            db.add(new_order)
-            db.flush()
-
-            for item in validated_items:
-                db.add(OrderItem(
-                    order_id=new_order.id,
-                    name=item["name"],
-                    price=item["price"],
-                    quantity=item["quantity"]
-                ))
-
-            return JSONResponse({
-                "success": True,
-                "merchant_reference": merchant_reference,
-                "calculated_amount": f"{total:.2f}",
-                "status": new_order.status
-            })
+        async with async_db_session() as db:
+            # Header: INSERT ... RETURNING hands back the id without a separate flush.
+            # ON CONFLICT DO NOTHING: a concurrent duplicate returns no row instead of failing
+            inserted = (await db.execute(
+                pg_insert(Order)
+                .values(
+                    merchant_reference=merchant_reference,
+                    user_id=user_id,
+                    total=round(total, 2),
+                    payment_type=payment_type,
+                    delivery_info=verified_delivery_info
+                )
+                .on_conflict_do_nothing(index_elements=[Order.merchant_reference])
+                .returning(Order.id, Order.status)
+            )).first()
+
+            if inserted is None:
+                existing = await find_existing_order(db, merchant_reference)
+            else:
+                # Lines: one executemany for every item
+                await db.execute(insert(OrderItem), [
+                    {"order_id": inserted.id, **item} for item in validated_items
+                ])
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Order creation failed: {str(e)}")
 
+    if inserted is None:
+        # Already stored (a resubmission not in memory, or a concurrent one that won the race)
+        if existing is None:
+            raise HTTPException(status_code=500, detail="Order creation failed: conflicting order not found")
+        remember_order(existing[0], idempotency_key if existing[0] == user_id else None, existing[1])
+        return replay_order(user_id, *existing)
+
+    body = order_response(merchant_reference, round(total, 2), inserted.status)
+    remember_order(user_id, idempotency_key, body)
+    return JSONResponse(body)
+
+
+# --- Helper: Order Filters ---
+def order_filters(user_id, status, payment_type, merchant_reference, date_from, date_to):
+    """Build the WHERE criteria for the order history filters (400 on bad dates)."""
+    criteria = [Order.user_id == user_id]
+
+    if status and status.strip():
+        criteria.append(Order.status.ilike(f"%{status.strip()}%"))
+    if payment_type and payment_type.strip():
+        criteria.append(Order.payment_type.ilike(f"%{payment_type.strip()}%"))
+    if merchant_reference and merchant_reference.strip():
+        criteria.append(Order.merchant_reference.ilike(f"%{merchant_reference.strip()}%"))
+
+    if date_from and date_from.strip():
+        try:
+            criteria.append(Order.created_at >= naive_utc(datetime.fromisoformat(date_from.strip())))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid date_from format")
+
+    if date_to and date_to.strip():
+        try:
+            criteria.append(Order.created_at <= naive_utc(datetime.fromisoformat(date_to.strip())))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid date_to format")
+
+    return criteria
+
+
+def naive_utc(value: datetime) -> datetime:
+    """Order timestamps are stored as naive UTC - convert offset-aware filter values to match."""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+# --- Helper: Order History Cursor ---
+def encode_order_cursor(o: Order) -> str:
+    """Opaque cursor pointing just after this order in (created_at, id) DESC order."""
+    raw = json.dumps({"c": o.created_at.isoformat(), "i": o.id})
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_order_cursor(cursor: str) -> tuple:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        data = json.loads(raw)
+        return datetime.fromisoformat(data["c"]), int(data["i"])
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def order_to_dict(o: Order) -> dict:
+    return {
+        "merchant_reference": o.merchant_reference,
+        "total": o.total,
+        "payment_type": o.payment_type,
+        "status": o.status,
+        "created_at": o.created_at.isoformat(),
+        "delivery_info": o.delivery_info,
+        "items": [{"name": i.name, "price": i.price, "quantity": i.quantity} for i in o.items],
+    }
+
+
+async def iter_orders(criteria):
+    """Yield every matching order, fetched from Postgres in batches (streamed exports)."""
+    async with async_db_session() as db:
+        stmt = (
+            select(Order)
+            .options(selectinload(Order.items))
+            .where(*criteria)
+            .order_by(Order.created_at.desc(), Order.id.desc())
+            .execution_options(yield_per=500)
+        )
+        result = await db.stream(stmt)
+        async for o in result.scalars():
+            yield order_to_dict(o)
+
 
 # --- Get All Orders for the Logged-in User ---
 @router.get("/orders/me")
-def get_user_orders(
+async def get_user_orders(
     request: Request,
     current_user=Depends(get_current_user),
     status: str | None = Query(None),
@@ -125,55 +320,82 @@ def get_user_orders(
     date_from: str | None = Query(None),
     date_to: str | None = Query(None),
     page: int = Query(1, ge=1),
-    page_size: int = Query(10, ge=1, le=100)
+    page_size: int = Query(10, ge=1, le=100),
+    cursor: str | None = Query(None),
+    count: str = Query("exact", pattern="^(exact|estimate|none)$"),
+    stream: bool = Query(False)
 ):
-    """Retrieve paginated and filterable orders for the authenticated user."""
+    """
+    Retrieve paginated and filterable orders for the authenticated user.
+
+    - ?page=N uses offset pagination (kept for existing clients).
+    - ?cursor=<next_cursor> continues after the last order of the previous
+      response (keyset on created_at, id) - every page costs the same, however deep.
+    - ?count=exact (default) returns the total from the same query via count(*) over(),
+      ?count=estimate uses the planner's row estimate, ?count=none skips it.
+
+    With ?stream=1 or Accept: application/x-ndjson the full (filtered) history
+    is streamed instead of paginated.
+    """
     user_id = str(current_user["_id"])
+    criteria = order_filters(user_id, status, payment_type, merchant_reference, date_from, date_to)
+
+    mode = stream_mode(request, stream)
+    if mode is not None:
+        return streaming_json_response(iter_orders(criteria), mode)
+
+    page_criteria = list(criteria)
+    if cursor:
+        created_at, last_id = decode_order_cursor(cursor)
+        page_criteria.append(tuple_(Order.created_at, Order.id) < tuple_(created_at, last_id))
+
+    # selectinload: LIMIT applies to orders, items come from one extra IN query
+    stmt = (
+        select(Order)
+        .options(selectinload(Order.items))
+        .where(*page_criteria)
+        .order_by(Order.created_at.desc(), Order.id.desc())
+        .limit(page_size)
+    )
+    if not cursor:
+        stmt = stmt.offset((page - 1) * page_size)
+
+    total_records = None
+    async with async_db_session() as db:
+        if count == "exact" and not cursor:
+            # count(*) over() is evaluated before LIMIT/OFFSET, so the page query also
+            # returns the total. Pages past the end (no rows) fall back to a separate count.
+            rows = (await db.execute(stmt.add_columns(func.count().over().label("total_records")))).all()
+            orders = [row[0] for row in rows]
+            if rows:
+                total_records = rows[0][1]
+            elif page > 1:
+                total_records = await db.scalar(
+                    select(func.count()).select_from(select(Order.id).where(*criteria).subquery())
+                )
+            else:
+                total_records = 0
+        elif count == "exact":
+            # Cursor page: the window would scan every row after the cursor, so only
+            # the page is read and the total comes from a separate count
+            orders = (await db.scalars(stmt)).all()
+            total_records = await db.scalar(
+                select(func.count()).select_from(select(Order.id).where(*criteria).subquery())
+            )
+        else:
+            orders = (await db.scalars(stmt)).all()
+            if count == "estimate":
+                total_records = await estimated_count(db, select(Order.id).where(*criteria))
 
-    with db_session() as db:
-        query = db.query(Order).options(joinedload(Order.items)).filter(Order.user_id == user_id)
-
-        if status and status.strip():
-            query = query.filter(Order.status.ilike(f"%{status.strip()}%"))
-        if payment_type and payment_type.strip():
-            query = query.filter(Order.payment_type.ilike(f"%{payment_type.strip()}%"))
-        if merchant_reference and merchant_reference.strip():
-            query = query.filter(Order.merchant_reference.ilike(f"%{merchant_reference.strip()}%"))
-
-        if date_from and date_from.strip():
-            try:
-                date_from_dt = datetime.fromisoformat(date_from.strip())
-                query = query.filter(Order.created_at >= date_from_dt)
-            except ValueError:
-                raise HTTPException(status_code=400, detail="Invalid date_from format")
-
-        if date_to and date_to.strip():
-            try:
-                date_to_dt = datetime.fromisoformat(date_to.strip())
-                query = query.filter(Order.created_at <= date_to_dt)
-            except ValueError:
-                raise HTTPException(status_code=400, detail="Invalid date_to format")
-
-        total_records = query.count()
-        orders = query.order_by(Order.created_at.desc()).offset((page - 1) * page_size).limit(page_size).all()
-
-        result = [
-            {
-                "merchant_reference": o.merchant_reference,
-                "total": o.total,
-                "payment_type": o.payment_type,
-                "status": o.status,
-                "created_at": o.created_at.isoformat(),
-                "delivery_info": o.delivery_info,
-                "items": [{"name": i.name, "price": i.price, "quantity": i.quantity} for i in o.items],
-            }
-            for o in orders
-        ]
+        result = [order_to_dict(o) for o in orders]
+        next_cursor = encode_order_cursor(orders[-1]) if len(orders) == page_size else None
 
     return JSONResponse({
         "page": page,
         "page_size": page_size,
         "total_records": total_records,
-        "total_pages": (total_records + page_size - 1) // page_size,
+        "total_pages": (total_records + page_size - 1) // page_size if total_records is not None else None,
+        "total_is_estimate": count == "estimate",
+        "next_cursor": next_cursor,
         "orders": result,
     })
\ No newline at end of file
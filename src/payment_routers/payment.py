@@ -1,14 +1,14 @@
 from fastapi import APIRouter, HTTPException, Depends
 from typing import Optional
 from jose import JWTError, jwt
-import httpx
+from helpers_routers.http_clients import get_http_client
 from helpers_routers.callpayV2_Token import generate_callpay_token
 from dotenv import load_dotenv
 import os
 from typing import cast
 import logging
 logger = logging.getLogger(__name__)
-from helpers_routers.helpers import get_current_user
+from helpers_routers.helpers import get_current_user, invalidate_user_cache
 from models import CreditCardPaymentRequest, EFTPaymentRequest, TokenPaymentRequest, TokenizeCardDataset
 from logs.loki_logger import push_to_loki
 
@@ -23,7 +23,7 @@ SECRET_KEY = cast(str, os.getenv("SECRET_KEY"))
 ALGORITHM = cast(str, os.getenv("ALGORITHM", "HS256"))
 
 from databaseConnections.mongoClient import get_collection
-users_collection = get_collection("store_users")
+users_collection = get_collection("store_users", use_async=True)
 
 def get_callpay_headers() -> dict:
     creds = generate_callpay_token()
@@ -35,8 +35,8 @@ def get_callpay_headers() -> dict:
     }
 
 #save guid as new field to mongodb where user_id match
-def save_guid_to_db(user_id: str, guid: str, expiryDate: str = "", lastFour: str = "", cardScheme = ""):
-    users_collection.update_one(
+async def save_guid_to_db(user_id: str, guid: str, expiryDate: str = "", lastFour: str = "", cardScheme = ""):
+    await users_collection.update_one(
         {"_id": ObjectId(user_id)},
         {"$set": {
             "billing_info.hashed_card_data": {
@@ -47,6 +47,7 @@ def save_guid_to_db(user_id: str, guid: str, expiryDate: str = "", lastFour: str
             }
         }}
     )
+    invalidate_user_cache(user_id)
 
     return (f"Saving GUID {guid} for customer {user_id} to the database")
 
@@ -75,13 +76,13 @@ async def create_eft_payment(payment: EFTPaymentRequest, current_user = Depends(
         "cancel_url": "https://kingburger.site/redirects/cancel"
     }
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{CALLPAY_BASE_URL}/payment-key",
-                data=payload,
-                headers=get_callpay_headers()
-            )
-            data = response.json()
+        client = get_http_client("callpay")
+        response = await client.post(
+            f"{CALLPAY_BASE_URL}/payment-key",
+            data=payload,
+            headers=get_callpay_headers()
+        )
+        data = response.json()
         # Returns { key, url, origin } — frontend redirects to data["url"]
         return {"status": "success", "response": data}
     except Exception as e:
@@ -111,13 +112,13 @@ async def create_card_payment(payment: CreditCardPaymentRequest, current_user =
         "cancel_url": "https://kingburger.site/redirects/cancel"
     }
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{CALLPAY_BASE_URL}/pay/direct",
-                data=payload,
-                headers=get_callpay_headers()
-            )
-            data = response.json()
+        client = get_http_client("callpay")
+        response = await client.post(
+            f"{CALLPAY_BASE_URL}/pay/direct",
+            data=payload,
+            headers=get_callpay_headers()
+        )
+        data = response.json()
         
         await push_to_loki("eft", "create_eft_payment_success", {
             "merchant_reference": payment.merchant_reference,
@@ -150,13 +151,13 @@ async def create_token_payment(payment: TokenPaymentRequest, current_user = Depe
         "cancel_url": "https://kingburger.site/redirects/cancel"
     }
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{CALLPAY_BASE_URL}/customer-token/{payment.guid}/pay",
-                data=payload,
-                headers=get_callpay_headers()
-            )
-            data = response.json()
+        client = get_http_client("callpay")
+        response = await client.post(
+            f"{CALLPAY_BASE_URL}/customer-token/{payment.guid}/pay",
+            data=payload,
+            headers=get_callpay_headers()
+        )
+        data = response.json()
 
         await push_to_loki("credit_card", "create_card_payment_success", {
             "merchant_reference": payment.merchant_reference,
@@ -191,15 +192,15 @@ async def tokenize_card(card: TokenizeCardDataset, current_user = Depends(get_cu
         "cancel_url": "https://kingburger.site/redirects/cancel"
     }
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{CALLPAY_BASE_URL}/customer-token/direct",
-                data=payload,
-                headers=get_callpay_headers()
-            )
-            data = response.json()
+        client = get_http_client("callpay")
+        response = await client.post(
+            f"{CALLPAY_BASE_URL}/customer-token/direct",
+            data=payload,
+            headers=get_callpay_headers()
+        )
+        data = response.json()
         if data.get("guid"):
-            save_guid_to_db(user_id, data["guid"], expiryDate=card.expiryDate, lastFour=card.cardNumber[-4:], cardScheme = card.cardScheme)
+            await save_guid_to_db(user_id, data["guid"], expiryDate=card.expiryDate, lastFour=card.cardNumber[-4:], cardScheme = card.cardScheme)
             await push_to_loki("tokenize", "tokenize_card_success", {
                 "merchant_reference": card.merchant_reference,
                 "user_id": user_id
@@ -2,13 +2,16 @@
 from fastapi import APIRouter, HTTPException, Header, Depends
 import os
 from typing import cast
-import httpx
+
+from helpers_routers.http_clients import get_http_client
+from helpers_routers.paypal_token import PayPalTokenManager
 
 from models import PayPalOrderRequest, PayPalCaptureRequest
 from logs.loki_logger import push_to_loki
 from helpers_routers.helpers import convert_currency
-from databaseConnections.postgresqlDB import db_session
+from databaseConnections.postgresqlDB import async_db_session
 from models import Order
+from sqlalchemy import select
 
 router = APIRouter()
 demo_mode = True
@@ -25,23 +28,36 @@ else:
     PAYPAL_TOKEN_URL = cast(str, os.getenv("PAYPAL_PROD_TOKEN_URL"))
     PAYPAL_API_URL = cast(str, os.getenv("PAYPAL_PROD_API_URL"))
 
+# Client-credentials token, cached until shortly before it expires
+paypal_tokens = PayPalTokenManager(PAYPAL_TOKEN_URL, paypal_username, paypal_password)
+
+# ------------------- Helper: Authenticated POST to PayPal -------------------
+async def paypal_post(url: str, payload: dict):
+    """POST to the PayPal API with the cached token; on 401 refresh it and retry once"""
+    client = get_http_client("paypal")
+    access_token = await paypal_tokens.get_token()
+    res = await client.post(
+        url,
+        json=payload,
+        headers={"Authorization": f"Bearer {access_token}", "Content-Type": "application/json"}
+    )
+
+    if res.status_code == 401:
+        paypal_tokens.invalidate()
+        access_token = await paypal_tokens.get_token(force_refresh=True)
+        res = await client.post(
+            url,
+            json=payload,
+            headers={"Authorization": f"Bearer {access_token}", "Content-Type": "application/json"}
+        )
+
+    return res
+
 @router.post("/api/paypal-new")
 async def new_payer_paypal_token():
-    
-    payload = {
-        "grant_type": "client_credentials",
-        "response_type": "id_token"
-    }
-    
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                PAYPAL_TOKEN_URL,
-                data=payload,
-                auth=(paypal_username, paypal_password)
-            )
-            data = response.json()
-            id_token = data["id_token"]
+        data = await paypal_tokens.get_token_data()
+        id_token = data["id_token"]
         
         return {"status": "success", "id_token": id_token,"response": data}
     except Exception as e:
@@ -57,14 +73,14 @@ async def existing_payer_paypal_token(customer_id: str):
     }
     
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                PAYPAL_API_URL,
-                data=payload,
-                auth=(paypal_username, paypal_password)
-            )
-            data = response.json()
-            id_token = data["id_token"]
+        client = get_http_client("paypal")
+        response = await client.post(
+            PAYPAL_API_URL,
+            data=payload,
+            auth=(paypal_username, paypal_password)
+        )
+        data = response.json()
+        id_token = data["id_token"]
         
         return {"status": "success", "id_token": id_token,"response": data}
     except Exception as e:
@@ -79,9 +95,6 @@ async def create_order(request: PayPalOrderRequest):
     try:
         amount_usd = await convert_currency(zar_amount, "ZAR", "USD")
 
-        token_response = await new_payer_paypal_token()
-        access_token = token_response['id_token']
-
         payload = {
             "intent": "CAPTURE",
             "purchase_units": [{
@@ -104,51 +117,46 @@ async def create_order(request: PayPalOrderRequest):
             }
         }
 
-        async with httpx.AsyncClient() as client:
-            res = await client.post(
-                f"{PAYPAL_API_URL}/v2/checkout/orders",
-                json=payload,
-                headers={"Authorization": f"Bearer {access_token}", "Content-Type": "application/json"}
-            )
+        res = await paypal_post(f"{PAYPAL_API_URL}/v2/checkout/orders", payload)
             
-            if res.status_code != 200:
-                await push_to_loki("paypal", "create_order_error", {
-                    "merchant_reference": merchant_reference,
-                    "amount": amount_usd,
-                    "status_code": res.status_code,
-                    "response": res.text
-                })
-                raise Exception(f"PayPal API returned {res.status_code}: {res.text}")
+        if res.status_code != 200:
+            await push_to_loki("paypal", "create_order_error", {
+                "merchant_reference": merchant_reference,
+                "amount": amount_usd,
+                "status_code": res.status_code,
+                "response": res.text
+            })
+            raise Exception(f"PayPal API returned {res.status_code}: {res.text}")
             
-            data = res.json()
-            paypal_order_id = data.get("id")
+        data = res.json()
+        paypal_order_id = data.get("id")
 
-            approve_url = next((l["href"] for l in data.get("links", []) if l["rel"] == "payer-action"), None)
+        approve_url = next((l["href"] for l in data.get("links", []) if l["rel"] == "payer-action"), None)
 
-            if not approve_url:
-                await push_to_loki("paypal", "create_order_error", {
-                    "merchant_reference": merchant_reference,
-                    "amount_usd": amount_usd,
-                    "error": "No payer-action URL in response"
-                })
-                raise Exception("PayPal did not return a payer-action URL")
-            
-            # ---------- Store Paypal Order Id in DB ----------- 
-            try:
-                with db_session() as db:
-                    order = db.query(Order).filter(Order.merchant_reference == merchant_reference).first()
-                    if order:
-                        order.paypal_order_id = paypal_order_id
-            except Exception as db_error:
-                db.rollback()
-                print(f"Failed to update paypal_order_id: {db_error}")
-                
-            await push_to_loki("paypal", "create_order_success", {
+        if not approve_url:
+            await push_to_loki("paypal", "create_order_error", {
                 "merchant_reference": merchant_reference,
-                "amount_zar": zar_amount,
                 "amount_usd": amount_usd,
-                "paypal_order_id": paypal_order_id
+                "error": "No payer-action URL in response"
             })
+            raise Exception("PayPal did not return a payer-action URL")
+            
+        # ---------- Store Paypal Order Id in DB ----------- 
+        try:
+            async with async_db_session() as db:
+                order = await db.scalar(select(Order).where(Order.merchant_reference == merchant_reference))
+                if order:
+                    order.paypal_order_id = paypal_order_id
+        except Exception as db_error:
+            # async_db_session has already rolled back
+            print(f"Failed to update paypal_order_id: {db_error}")
+                
+        await push_to_loki("paypal", "create_order_success", {
+            "merchant_reference": merchant_reference,
+            "amount_zar": zar_amount,
+            "amount_usd": amount_usd,
+            "paypal_order_id": paypal_order_id
+        })
         return {"approve_url": approve_url}
         
     except Exception as e:
@@ -167,43 +175,35 @@ async def capture_order(request: PayPalCaptureRequest):
     merchant_reference = request.merchant_reference
     
     try:
-        token_response = await new_payer_paypal_token()
-        access_token = token_response['id_token']
-
         payload = {}  # Capture doesn't need a body, just the order_id in the URL
 
-        async with httpx.AsyncClient() as client:
-            res = await client.post(
-                f"{PAYPAL_API_URL}/v2/checkout/orders/{order_id}/capture",
-                json=payload,
-                headers={"Authorization": f"Bearer {access_token}", "Content-Type": "application/json"}
-            )
+        res = await paypal_post(f"{PAYPAL_API_URL}/v2/checkout/orders/{order_id}/capture", payload)
             
-            if res.status_code not in (200, 201):
-                await push_to_loki("paypal", "capture_order_error", {
-                    "merchant_reference": merchant_reference,
-                    "order_id": order_id,
-                    "status_code": res.status_code,
-                    "response": res.text
-                })
-                raise Exception(f"PayPal capture failed {res.status_code}: {res.text}")
+        if res.status_code not in (200, 201):
+            await push_to_loki("paypal", "capture_order_error", {
+                "merchant_reference": merchant_reference,
+                "order_id": order_id,
+                "status_code": res.status_code,
+                "response": res.text
+            })
+            raise Exception(f"PayPal capture failed {res.status_code}: {res.text}")
             
-            data = res.json()
+        data = res.json()
             
-            if data.get("status") == "COMPLETED":
-                await push_to_loki("paypal", "capture_order_success", {
-                    "merchant_reference": merchant_reference,
-                    "order_id": order_id,
-                    "paypal_status": data.get("status")
-                })
-                return {"status": "success", "order_id": order_id}
-            else:
-                await push_to_loki("paypal", "capture_order_incomplete", {
-                    "merchant_reference": merchant_reference,
-                    "order_id": order_id,
-                    "paypal_status": data.get("status")
-                })
-                raise Exception(f"Payment status: {data.get('status')}")
+        if data.get("status") == "COMPLETED":
+            await push_to_loki("paypal", "capture_order_success", {
+                "merchant_reference": merchant_reference,
+                "order_id": order_id,
+                "paypal_status": data.get("status")
+            })
+            return {"status": "success", "order_id": order_id}
+        else:
+            await push_to_loki("paypal", "capture_order_incomplete", {
+                "merchant_reference": merchant_reference,
+                "order_id": order_id,
+                "paypal_status": data.get("status")
+            })
+            raise Exception(f"Payment status: {data.get('status')}")
         
     except Exception as e:
         await push_to_loki("paypal", "capture_order_exception", {
@@ -0,0 +1,198 @@
+"""
+Response Cache Middleware
+
+Server-side shared cache for public GET endpoints. CacheControlMiddleware only
+tells browsers/CDNs how long to keep a response; every new visitor (or a
+"no-cache" reload) would still run the handler. This middleware keeps the
+serialized body of successful responses for routes the cache policy marks
+public (/products* and /) and replays it without calling the handler.
+
+Entries are keyed by path + query string, expire after the route's max-age
+(capped by RESPONSE_CACHE_TTL) and are evicted least-recently-used once
+RESPONSE_CACHE_SIZE entries are stored.
+
+Writes must call purge_response_cache() - the product create/update/delete
+endpoints purge "/products".
+
+Conditional GET: handlers can return conditional_json_response(), which adds a
+strong ETag (hash of the body) and Last-Modified, and answers 304 with no body
+when If-None-Match / If-Modified-Since show the client's copy is current. Cached
+entries keep those headers, so revalidating a hot listing is a dict lookup.
+"""
+
+import hashlib
+import os
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
+
+from fastapi import Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
+
+from cache_middleware import compile_cache_policies
+from helpers_routers.ttl_cache import TTLCache
+
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", "600"))                # seconds (upper bound)
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "512"))              # entries
+RESPONSE_CACHE_MAX_BODY = int(os.getenv("RESPONSE_CACHE_MAX_BODY", "1048576"))  # bytes per entry
+
+# (path, query_string) -> (status, headers, body)
+_response_cache = TTLCache(maxsize=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL)
+
+
+def purge_response_cache(prefix: str = "/") -> int:
+    """Drop cached responses whose path starts with prefix (all of them by default)"""
+    return _response_cache.discard_where(lambda key, _: key[0].startswith(prefix))
+
+
+def response_cache_stats() -> dict:
+    return _response_cache.stats()
+
+
+# ==================== CONDITIONAL GET ====================
+def make_etag(body: bytes) -> str:
+    """Strong ETag derived from the exact response bytes"""
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def http_date(value: datetime) -> str:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)  # Mongo returns naive UTC datetimes
+    return format_datetime(value.astimezone(timezone.utc), usegmt=True)
+
+
+def is_not_modified(if_none_match: Optional[str], if_modified_since: Optional[str],
+                    etag: Optional[str], last_modified: Optional[str]) -> bool:
+    """RFC 9110 rules: If-None-Match wins; If-Modified-Since is only used without it"""
+    if if_none_match is not None:
+        if etag is None:
+            return False
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        # If-None-Match uses weak comparison - ignore any W/ prefix
+        return "*" in tags or etag.removeprefix("W/") in (tag.removeprefix("W/") for tag in tags)
+
+    if if_modified_since is not None and last_modified is not None:
+        try:
+            return parsedate_to_datetime(last_modified) <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+
+    return False
+
+
+def _not_modified_headers(headers: dict) -> dict:
+    return {name: value for name, value in headers.items() if name in ("etag", "last-modified")}
+
+
+def conditional_json_response(request: Request, content, last_modified: Optional[datetime] = None) -> Response:
+    """JSON response with ETag/Last-Modified, or a bodyless 304 if the client is up to date"""
+    response = JSONResponse(jsonable_encoder(content))
+    response.headers["etag"] = make_etag(response.body)
+    if last_modified is not None:
+        response.headers["last-modified"] = http_date(last_modified)
+
+    if is_not_modified(
+        request.headers.get("if-none-match"),
+        request.headers.get("if-modified-since"),
+        response.headers.get("etag"),
+        response.headers.get("last-modified"),
+    ):
+        return Response(status_code=304, headers=_not_modified_headers(response.headers))
+
+    return response
+
+
+class ResponseCacheMiddleware:
+    def __init__(self, app):
+        self.app = app
+        self.policies = compile_cache_policies()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "GET":
+            await self.app(scope, receive, send)
+            return
+
+        # Only routes with an explicit public policy - never the catch-all default
+        rule = self.policies.resolve(scope["path"])
+        if not rule.public or rule is self.policies.default:
+            await self.app(scope, receive, send)
+            return
+
+        # NDJSON exports share the URL of the buffered JSON response - never mix them up
+        request_headers = dict(scope["headers"])
+        if b"application/x-ndjson" in request_headers.get(b"accept", b""):
+            await self.app(scope, receive, send)
+            return
+
+        key = (scope["path"], scope.get("query_string", b"").decode("latin-1"))
+
+        cached = _response_cache.get(key)
+        if cached is not None:
+            status, headers, body = cached
+
+            if b"if-none-match" in request_headers or b"if-modified-since" in request_headers:
+                stored = {name.decode("latin-1"): value.decode("latin-1") for name, value in headers}
+                if is_not_modified(
+                    request_headers.get(b"if-none-match", b"").decode("latin-1") or None,
+                    request_headers.get(b"if-modified-since", b"").decode("latin-1") or None,
+                    stored.get("etag"),
+                    stored.get("last-modified"),
+                ):
+                    await send({
+                        "type": "http.response.start",
+                        "status": 304,
+                        "headers": [
+                            (name.encode("latin-1"), value.encode("latin-1"))
+                            for name, value in _not_modified_headers(stored).items()
+                        ] + [(b"x-cache", b"HIT")],
+                    })
+                    await send({"type": "http.response.body", "body": b""})
+                    return
+
+            await send({
+                "type": "http.response.start",
+                "status": status,
+                "headers": headers + [(b"x-cache", b"HIT")],
+            })
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        start_message = None
+        chunks = []
+        size = 0
+        cacheable = True
+
+        async def send_and_capture(message):
+            nonlocal start_message, size, cacheable
+
+            if message["type"] == "http.response.start":
+                start_message = message
+                # Streamed responses (no Content-Length) are exports - don't buffer them
+                cacheable = message["status"] == 200 and any(
+                    name == b"content-length" for name, _ in message.get("headers", [])
+                )
+                message["headers"] = list(message.get("headers", [])) + [(b"x-cache", b"MISS")]
+
+            elif message["type"] == "http.response.body" and cacheable:
+                body = message.get("body", b"")
+                size += len(body)
+                if size > RESPONSE_CACHE_MAX_BODY:
+                    cacheable = False
+                    chunks.clear()
+                else:
+                    chunks.append(body)
+                    if not message.get("more_body", False):
+                        headers = [
+                            (name, value) for name, value in start_message["headers"]
+                            if name != b"x-cache"
+                        ]
+                        _response_cache.set(
+                            key,
+                            (start_message["status"], headers, b"".join(chunks)),
+                            ttl=min(rule.max_age, RESPONSE_CACHE_TTL),
+                        )
+
+            await send(message)
+
+        await self.app(scope, receive, send_and_capture)
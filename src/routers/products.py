@@ -3,7 +3,7 @@ PRODUCTS ROUTER - Handles all cleaning product operations
 This file manages: viewing, creating, updating, and deleting cleaning products
 """
 
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Request, Query
 from pymongo import MongoClient
 from bson import ObjectId
 from typing import Optional, List, cast
@@ -20,72 +20,188 @@ router = APIRouter(prefix="/products", tags=["products"])
 
 # Connect to MongoDB database
 from databaseConnections.mongoClient import get_collection
-products_collection = get_collection("products")
+products_collection = get_collection("products", use_async=True)
 
-# ==================== HELPER FUNCTION ====================
-def clean_product_data(product):
+# Reads are served from the in-process catalog cache; writes below keep it in sync
+from helpers_routers.catalog_cache import (
+    clean_product_data,
+    get_product_list,
+    get_product,
+    cache_product,
+    invalidate_product,
+    last_modified,
+    listing_last_modified,
+    get_product_page,
+    parse_fields,
+    iter_products,
+)
+from helpers_routers.streaming import stream_mode, streaming_json_response
+from helpers_routers.product_search import search_products
+from response_cache import purge_response_cache, conditional_json_response
+
+# ==================== PAGINATION HELPER ====================
+DEFAULT_PAGE_SIZE = 24
+
+def streamed_products(request, category, stream, fields):
     """
-    Convert MongoDB's _id (ObjectId) to a regular string 'id'
-    This makes it JSON-friendly for sending to frontend
+    Stream the full listing as NDJSON / a JSON array when the client asked for it
+    (Accept: application/x-ndjson or ?stream=1). Returns None otherwise.
     """
-    if product:
-        product["id"] = str(product["_id"])  # Convert ObjectId to string
-        del product["_id"]  # Remove the old _id field
-    return product
+    mode = stream_mode(request, stream)
+    if mode is None:
+        return None
+    try:
+        projection = parse_fields(fields)
+    except ValueError as error:
+        raise HTTPException(status_code=400, detail=str(error))
+    return streaming_json_response(iter_products(category, projection), mode)
+
+async def paged_products(category, limit, cursor, fields):
+    """
+    Load one keyset page when the caller asked for pagination or a projection.
+    Returns None when none of limit / cursor / fields were given (full listing).
+    """
+    if limit is None and cursor is None and fields is None:
+        return None
+    try:
+        return await get_product_page(category, limit or DEFAULT_PAGE_SIZE, cursor, parse_fields(fields))
+    except ValueError as error:
+        raise HTTPException(status_code=400, detail=str(error))
 
 # ==================== GET ALL PRODUCTS ====================
 @router.get("/")
-async def get_all_products(category: Optional[int] = None):
+async def get_all_products(
+    request: Request,
+    category: Optional[int] = None,
+    limit: Optional[int] = Query(None, ge=1, le=100),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    stream: bool = False
+):
     """
     Get all cleaning products from database
     
     Examples:
     - GET /products/ → returns all products
     - GET /products/?category=1 → returns only category 1 (services)
+    - GET /products/?limit=24 → first page, plus "next_cursor" for the next one
+    - GET /products/?limit=24&cursor=<next_cursor> → following page
+    - GET /products/?limit=24&fields=name,price,image_url,slug → only those fields (+ id)
+    - GET /products/?stream=1 (or Accept: application/x-ndjson) → streamed full export
     """
     try:
-        # Build search query
-        search_query = {}
-        if category:
-            search_query["category"] = category
-        
-        # Get products from database (newest first)
-        products = list(products_collection.find(search_query).sort("created_at", -1))
-        
-        # Clean up the data for frontend
-        cleaned_products = [clean_product_data(p) for p in products]
+        streamed = streamed_products(request, category or None, stream, fields)
+        if streamed is not None:
+            return streamed
+
+        page = await paged_products(category or None, limit, cursor, fields)
+        if page is not None:
+            products, next_cursor, page_last_modified = page
+            return conditional_json_response(request, {
+                "success": True,
+                "count": len(products),
+                "products": products,
+                "next_cursor": next_cursor
+            }, page_last_modified)
+
+        # Get products (newest first) - served from the catalog cache when warm
+        cleaned_products = await get_product_list(category or None)
         
-        return {
+        # ETag / Last-Modified let browsers revalidate with a bodyless 304
+        return conditional_json_response(request, {
             "success": True,
             "count": len(cleaned_products),
             "products": cleaned_products
-        }
+        }, listing_last_modified(cleaned_products))
     
+    except HTTPException:
+        raise
+
     except Exception as error:
         print(f"❌ Error getting products: {error}")
         raise HTTPException(status_code=500, detail="Could not fetch products")
 
+# ==================== SEARCH PRODUCTS ====================
+# Declared before /{product_id} so "search" is not treated as an id
+@router.get("/search")
+async def search_catalog(
+    request: Request,
+    q: str = "",
+    category: Optional[int] = None,
+    min_price: Optional[float] = Query(None, ge=0),
+    max_price: Optional[float] = Query(None, ge=0),
+    availability_status: Optional[List[str]] = Query(None),
+    brand: Optional[List[str]] = Query(None),
+    tags: Optional[List[str]] = Query(None),
+    limit: int = Query(24, ge=1, le=100),
+    offset: int = Query(0, ge=0)
+):
+    """
+    Ranked text search over name, short_description, description, brand and tags
+
+    Examples:
+    - GET /products/search?q=intel core → best matches first ("score" on each product)
+    - GET /products/search?q=cleaner&max_price=200&availability_status=in_stock
+    - GET /products/search?brand=Intel&brand=AMD&tags=gaming → repeat a param to allow several values
+    - GET /products/search?category=2 → no text, just filters and facets
+
+    "facets" counts brand / availability_status / tags / category over all matches.
+    """
+    try:
+        if min_price is not None and max_price is not None and min_price > max_price:
+            raise HTTPException(status_code=400, detail="min_price cannot be greater than max_price")
+
+        results = await search_products(
+            q,
+            category=category,
+            min_price=min_price,
+            max_price=max_price,
+            availability_status=availability_status,
+            brands=brand,
+            tags=tags,
+            limit=limit,
+            offset=offset
+        )
+
+        return conditional_json_response(request, {
+            "success": True,
+            "query": q,
+            "total": results["total"],
+            "count": len(results["products"]),
+            "products": results["products"],
+            "facets": results["facets"]
+        })
+
+    except HTTPException:
+        raise
+
+    except Exception as error:
+        print(f"❌ Error searching products: {error}")
+        raise HTTPException(status_code=500, detail="Could not search products")
+
 # ==================== GET ONE PRODUCT ====================
 @router.get("/{product_id}")
-async def get_single_product(product_id: str):
+async def get_single_product(request: Request, product_id: str):
     """
     Get one specific product by its ID
     
     Example: GET /products/68ded7ef3ca60b183a391f4a
     """
     try:
-        # Find product in database
-        product = products_collection.find_one({"_id": ObjectId(product_id)})
+        # Find product (catalog cache first, then database)
+        product = await get_product(product_id)
         
         # Check if we found it
         if not product:
             raise HTTPException(status_code=404, detail="Product not found")
         
-        return {
+        return conditional_json_response(request, {
             "success": True,
-            "product": clean_product_data(product)
-        }
+            "product": product
+        }, last_modified([product]))
     
+    except HTTPException:
+        raise
     except Exception as error:
         print(f"❌ Error getting product {product_id}: {error}")
         raise HTTPException(status_code=500, detail="Could not fetch product")
@@ -141,15 +257,19 @@ async def create_new_product(
         }
         
         # Insert into database
-        result = products_collection.insert_one(new_product)
+        result = await products_collection.insert_one(new_product)
         
         # Get the newly created product
-        created_product = products_collection.find_one({"_id": result.inserted_id})
+        created_product = clean_product_data(
+            await products_collection.find_one({"_id": result.inserted_id})
+        )
+        cache_product(created_product)
+        purge_response_cache("/products")
         
         return {
             "success": True,
             "message": "Product created successfully!",
-            "product": clean_product_data(created_product)
+            "product": created_product
         }
     
     except Exception as error:
@@ -215,15 +335,21 @@ async def create_bulk_products(
             })
         
         # Insert into database
-        result = products_collection.insert_many(new_products)
+        result = await products_collection.insert_many(new_products)
         
         # Get the newly created products
-        created_products = list(products_collection.find({"_id": {"$in": result.inserted_ids}}))
+        created_products = [
+            clean_product_data(p)
+            async for p in products_collection.find({"_id": {"$in": result.inserted_ids}})
+        ]
+        for product in created_products:
+            cache_product(product)
+        purge_response_cache("/products")
         
         return {
             "success": True,
             "message": f"{len(created_products)} products created successfully!",
-            "products": [clean_product_data(p) for p in created_products]
+            "products": created_products
         }
     
     except Exception as error:
@@ -295,8 +421,11 @@ async def update_existing_product(
         if not update_fields:
             raise HTTPException(status_code=400, detail="No fields to update")
         
+        # Drives Last-Modified on the product read endpoints
+        update_fields["updated_at"] = datetime.now(timezone.utc)
+        
         # Update in database
-        result = products_collection.update_one(
+        result = await products_collection.update_one(
             {"_id": ObjectId(product_id)},
             {"$set": update_fields}
         )
@@ -306,12 +435,18 @@ async def update_existing_product(
             raise HTTPException(status_code=404, detail="Product not found")
         
         # Get the updated product
-        updated_product = products_collection.find_one({"_id": ObjectId(product_id)})
+        updated_product = await products_collection.find_one({"_id": ObjectId(product_id)})
+        if updated_product:
+            updated_product = clean_product_data(updated_product)
+            cache_product(updated_product)
+        else:
+            invalidate_product(product_id)
+        purge_response_cache("/products")
         
         return {
             "success": True,
             "message": "Product updated successfully!",
-            "product": clean_product_data(updated_product)
+            "product": updated_product
         }
     
     except Exception as error:
@@ -333,12 +468,15 @@ async def delete_product(
     """
     try:
         # Delete from database
-        result = products_collection.delete_one({"_id": ObjectId(product_id)})
+        result = await products_collection.delete_one({"_id": ObjectId(product_id)})
         
         # Check if product was found and deleted
         if result.deleted_count == 0:
             raise HTTPException(status_code=404, detail="Product not found")
         
+        invalidate_product(product_id)
+        purge_response_cache("/products")
+        
         return {
             "success": True,
             "message": "Product deleted successfully!",
@@ -351,7 +489,14 @@ async def delete_product(
 
 # ==================== GET BY CATEGORY ====================
 @router.get("/category/{category_number}")
-async def get_products_by_category(category_number: int):
+async def get_products_by_category(
+    request: Request,
+    category_number: int,
+    limit: Optional[int] = Query(None, ge=1, le=100),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    stream: bool = False
+):
     """
     Get all products in a specific category
     
@@ -361,17 +506,13 @@ async def get_products_by_category(category_number: int):
     3 = Packages (Monthly subscriptions, Bundle deals, etc.)
     
     Example: GET /products/category/1 → gets all cleaning services
+    Supports the same limit / cursor / fields / stream parameters as GET /products/
     """
     try:
-        # Find all products with this category
-        products = list(
-            products_collection.find({"category": category_number})
-            .sort("created_at", -1)
-        )
-        
-        # Clean up the data
-        cleaned_products = [clean_product_data(p) for p in products]
-        
+        streamed = streamed_products(request, category_number, stream, fields)
+        if streamed is not None:
+            return streamed
+
         # Category names for reference
         category_names = {
             1: "Cleaning Services",
@@ -379,14 +520,32 @@ async def get_products_by_category(category_number: int):
             3: "Packages"
         }
         
-        return {
+        page = await paged_products(category_number, limit, cursor, fields)
+        if page is not None:
+            products, next_cursor, page_last_modified = page
+            return conditional_json_response(request, {
+                "success": True,
+                "category": category_number,
+                "category_name": category_names.get(category_number, "Unknown"),
+                "count": len(products),
+                "products": products,
+                "next_cursor": next_cursor
+            }, page_last_modified)
+
+        # Find all products with this category (catalog cache first)
+        cleaned_products = await get_product_list(category_number)
+        
+        return conditional_json_response(request, {
             "success": True,
             "category": category_number,
             "category_name": category_names.get(category_number, "Unknown"),
             "count": len(cleaned_products),
             "products": cleaned_products
-        }
+        }, listing_last_modified(cleaned_products))
     
+    except HTTPException:
+        raise
+
     except Exception as error:
         print(f"❌ Error getting category {category_number}: {error}")
         raise HTTPException(status_code=500, detail="Could not fetch category products")
\ No newline at end of file
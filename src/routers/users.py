@@ -7,14 +7,14 @@ from fastapi import APIRouter, HTTPException, Depends, Request, Form
 from bson import ObjectId
 from bson.errors import InvalidId
 from typing import Optional
-from passlib.hash import argon2 as ph
 
-from helpers_routers.helpers import get_current_user
+from helpers_routers.helpers import get_current_user, invalidate_user_cache
+from helpers_routers.password_hashing import hash_password
 from databaseConnections.mongoClient import get_collection
 
 router = APIRouter(prefix="/users", tags=["users"])
 
-users_collection = get_collection("store_users")
+users_collection = get_collection("store_users", use_async=True)
 
 
 # ==================== GET DASHBOARD INFO ====================
@@ -54,7 +54,7 @@ async def add_or_update_billing_address(
     billing_address.pop("address_name")
 
     try:
-        update_result = users_collection.update_one(
+        update_result = await users_collection.update_one(
             {"_id": ObjectId(current_user["_id"])},
             {"$set": {f"billing_info.billing_address.{address_name}": billing_address}}
         )
@@ -62,6 +62,8 @@ async def add_or_update_billing_address(
         if update_result.matched_count == 0:
             raise HTTPException(status_code=404, detail="User not found")
 
+        invalidate_user_cache(current_user["_id"])
+
         return {
             "success": True,
             "message": "Billing information updated successfully"
@@ -84,7 +86,7 @@ async def get_user_profile(user_id: str, current_user=Depends(get_current_user))
         raise HTTPException(status_code=403, detail="Not authorized to access this profile")
 
     try:
-        target_user = users_collection.find_one({"_id": ObjectId(user_id)})
+        target_user = await users_collection.find_one({"_id": ObjectId(user_id)})
 
         if not target_user:
             raise HTTPException(status_code=404, detail="User not found")
@@ -147,14 +149,14 @@ async def update_user_profile(
             raise HTTPException(status_code=400, detail="No valid fields to update")
 
         if "password" in safe_data:
-            safe_data["password"] = ph.hash(safe_data["password"])
+            safe_data["password"] = await hash_password(safe_data["password"])
 
         if "userName" in safe_data:
-            existing = users_collection.find_one({"userName": safe_data["userName"]})
+            existing = await users_collection.find_one({"userName": safe_data["userName"]})
             if existing and str(existing["_id"]) != user_id:
                 raise HTTPException(status_code=400, detail="Username already taken")
 
-        update_result = users_collection.update_one(
+        update_result = await users_collection.update_one(
             {"_id": ObjectId(user_id)},
             {"$set": safe_data}
         )
@@ -162,6 +164,8 @@ async def update_user_profile(
         if update_result.matched_count == 0:
             raise HTTPException(status_code=404, detail="User not found")
 
+        invalidate_user_cache(user_id)
+
         return {
             "success": True,
             "message": "User profile updated successfully"
@@ -190,11 +194,13 @@ async def delete_user_profile(user_id: str, current_user=Depends(get_current_use
         raise HTTPException(status_code=403, detail="Not authorized to delete this profile")
 
     try:
-        delete_result = users_collection.delete_one({"_id": ObjectId(user_id)})
+        delete_result = await users_collection.delete_one({"_id": ObjectId(user_id)})
 
         if delete_result.deleted_count == 0:
             raise HTTPException(status_code=404, detail="User not found")
 
+        invalidate_user_cache(user_id)
+
         return {
             "success": True,
             "message": "User profile deleted successfully"
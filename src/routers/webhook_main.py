@@ -1,4 +1,4 @@
-from fastapi import Request, HTTPException, APIRouter, Depends
+from fastapi import Request, HTTPException, APIRouter, Depends, Query
 from fastapi.responses import JSONResponse
 import sys
 import os
@@ -7,22 +7,20 @@ from pythonjsonlogger.json import JsonFormatter
 from datetime import datetime, timezone
 from typing import cast
 from urllib.parse import parse_qs
-from models import Order
-from helpers_routers.helpers import get_origin_ip, log_event
-from databaseConnections.postgresqlDB import db_session
+from helpers_routers.helpers import get_origin_ip, log_event, invalidate_user_cache, require_role
+from databaseConnections.postgresqlDB import async_db_session
 import httpx, json, time
 from logs.loki_logger import push_to_loki
-from pymongo import MongoClient
+from helpers_routers.webhook_queue import enqueue_event, register_handler, replay_failed_events, PermanentWebhookError
+from orderCreation.order_status import transition_order, callpay_order_status, UnknownPaymentStatus
+from databaseConnections.mongoClient import get_collection
 
 
 # ------------------- Configuration -------------------
 IP_WHITELIST = [ip.strip() for ip in os.getenv("IP_WHITELIST", "").split(",") if ip.strip()]
 router = APIRouter(tags=["webhook"])
 
-MONGO_URI = cast(str, os.getenv("MONGO_URI"))
-client = MongoClient(MONGO_URI, tls=True, tlsAllowInvalidCertificates=False)
-db = client["kingburgerstore_db"]
-users_collection = db["store_users"]
+users_collection = get_collection("store_users", use_async=True)
 
 #------------------- Helper: Parse Payload from urlencoded to JSON -------------------
 async def get_payload(request: Request):
@@ -35,29 +33,10 @@ async def get_payload(request: Request):
         return await request.json()
 
 # Save Paypal Vault ID to Mongo where email match
-def update_order_status(db, merchant_reference: str, status: str, reason: str = None) -> str:
-    """Update order status in the database."""
-    if not merchant_reference:
-        return "invalid_reference"
-
-    order = db.query(Order).filter(Order.merchant_reference == merchant_reference).first()
-    if not order:
-        return "order_not_found"
-
-    try:
-        order.status = status
-        order.reason = reason
-        order.updated_at = datetime.now(timezone.utc)
-        db.commit()
-        return "order_updated"
-    except Exception as e:
-        db.rollback()
-        return (f"order_update_error: {str(e)}")
-
 #save guid as new field to mongodb where user_id match
-def save_paypal_vault_id(paypal_email: str, vault_id: str = ""):
+async def save_paypal_vault_id(paypal_email: str, vault_id: str = ""):
     try:
-        result = users_collection.update_one(
+        result = await users_collection.update_one(
             {"email": paypal_email},
             {"$set": {
                 "billing_info.paypal_vault": {
@@ -71,13 +50,168 @@ def save_paypal_vault_id(paypal_email: str, vault_id: str = ""):
             print(f"User with email {paypal_email} not found")
             return f"Error: User {paypal_email} not found"
         
+        invalidate_user_cache(email=paypal_email)
+        
         return (f"Saving GUID {vault_id} for customer {paypal_email} to the database")
     except Exception as e:
         print(f"Error saving vault ID: {e}")
         return f"Error saving vault ID: {str(e)}"
 
+# ------------------- Helper: Event Ids & Ordering Keys -------------------
+def callpay_event_id(payload: dict):
+    """Callpay retries resend the same transaction + status; a new status is a new event"""
+    transaction_id = (
+        payload.get("callpay_transaction_id")
+        or payload.get("transaction_id")
+        or payload.get("id")
+    )
+    if not transaction_id:
+        return None
+    return f"{transaction_id}:{payload.get('status')}"
+
+def paypal_order_id_of(payload: dict):
+    """paypal_order_id an event refers to (capture events carry it in supplementary_data)"""
+    event_type = payload.get("event_type")
+    resource = payload.get("resource", {})
+    if event_type == "CHECKOUT.ORDER.COMPLETED":
+        return resource.get("id")
+    return resource.get("supplementary_data", {}).get("related_ids", {}).get("order_id")
+
+# ------------------- Queue Handler: Callpay -------------------
+async def process_callpay_event(payload: dict, origin_ip: str = None):
+    """Apply a Callpay notification - runs in the webhook queue worker, raises to retry"""
+    await push_to_loki("webhook", "webhook_received", payload)
+
+    merchant_reference = payload.get("merchant_reference")
+    status = payload.get("status")
+    reason = payload.get("reason")
+
+    if merchant_reference:
+        try:
+            order_status = callpay_order_status(payload)
+        except UnknownPaymentStatus as e:
+            # Fails the queue event (visible with last_error, replayable) instead of dropping it
+            log_event("error", "payment_status_unmapped", origin_ip=origin_ip, status=status, merchant_reference=merchant_reference)
+            raise PermanentWebhookError(str(e))
+        if order_status is None:
+            log_event("info", "payment_in_progress", origin_ip=origin_ip, status=status, merchant_reference=merchant_reference)
+            return
+
+        # Database errors propagate so the queue retries the event
+        async with async_db_session() as db:
+            success = await transition_order(db, order_status, reason, merchant_reference=merchant_reference)
+        log_event("info", "payment_processed", origin_ip=origin_ip, status=status, success=success, merchant_reference=merchant_reference, reason=reason)
+
+# ------------------- Queue Handler: PayPal -------------------
+async def process_paypal_event(payload: dict, origin_ip: str = None):
+    """Apply a PayPal notification - runs in the webhook queue worker, raises to retry"""
+    event_type = payload.get("event_type")
+    resource = payload.get("resource", {})
+
+    paypal_order_id = paypal_order_id_of(payload)
+
+    await push_to_loki("paypal_webhook", "paypal_webhook_received", {
+        "event_type": event_type,
+        "paypal_order_id": paypal_order_id,
+        "status": resource.get("status"),
+        "origin_ip": origin_ip
+    })
+
+    # Handle CHECKOUT.ORDER.COMPLETED event
+    if event_type == "CHECKOUT.ORDER.COMPLETED":
+        status = resource.get("status")
+
+        if paypal_order_id and status == "APPROVED":
+            async with async_db_session() as db:
+                result = await transition_order(db, "approved", "PayPal approved - awaiting capture",
+                                                paypal_order_id=paypal_order_id)
+            if result == "order_updated":
+                await push_to_loki("paypal_webhook", "paypal_order_approved", {
+                    "paypal_order_id": paypal_order_id,
+                    "status": status
+                })
+
+                log_event("info", "paypal_order_approved",
+                    paypal_order_id=paypal_order_id,
+                    status=status
+                )
+
+    # Handle PAYMENT.CAPTURE.COMPLETED event
+    elif event_type == "PAYMENT.CAPTURE.COMPLETED":
+        status = resource.get("status")
+
+        if status == "COMPLETED" and paypal_order_id:
+            async with async_db_session() as db:
+                result = await transition_order(db, "completed", "Payment captured successfully",
+                                                paypal_order_id=paypal_order_id)
+            if result == "order_updated":
+                await push_to_loki("paypal_webhook", "paypal_payment_captured", {
+                    "paypal_order_id": paypal_order_id,
+                    "status": status
+                })
+
+                log_event("info", "paypal_payment_captured",
+                    paypal_order_id=paypal_order_id,
+                    status=status
+                )
+
+    # Handle VAULT.PAYMENT-TOKEN.CREATED event
+    elif event_type == "VAULT.PAYMENT-TOKEN.CREATED":
+        vault_id = resource.get("id")
+        paypal_email = resource.get("payment_source", {}).get("paypal", {}).get("email_address")
+        
+        if vault_id and paypal_email:
+            result = await save_paypal_vault_id(paypal_email, vault_id)
+
+            await push_to_loki("paypal_webhook", "vault_token_created", {
+                "vault_id": vault_id,
+                "paypal_email": paypal_email,
+                "result": result
+            })
+
+    # Handle payment failures
+    elif event_type in ["PAYMENT.CAPTURE.DENIED", "PAYMENT.CAPTURE.REFUNDED"]:
+        reason = resource.get("status_details", {}).get("reason", "Unknown reason")
+
+        # A refund arrives after the capture, so it may also move a completed order
+        allowed_from = ("pending", "approved", "completed") if event_type == "PAYMENT.CAPTURE.REFUNDED" else None
+
+        if paypal_order_id:
+            async with async_db_session() as db:
+                result = await transition_order(db, "failed", f"PayPal: {event_type} - {reason}",
+                                                paypal_order_id=paypal_order_id, allowed_from=allowed_from)
+            if result == "order_updated":
+                await push_to_loki("paypal_webhook", "paypal_payment_failed", {
+                    "paypal_order_id": paypal_order_id,
+                    "event_type": event_type,
+                    "reason": reason
+                })
+
+                log_event("error", "paypal_payment_failed",
+                    paypal_order_id=paypal_order_id,
+                    event_type=event_type,
+                    reason=reason
+                )
+
+register_handler("callpay", process_callpay_event)
+register_handler("paypal", process_paypal_event)
+
+# ------------------- Admin: Replay Failed Events -------------------
+@router.post("/admin/webhooks/replay", include_in_schema=False)
+async def replay_webhooks(
+    provider: str | None = None,
+    event_id: list[int] | None = Query(None),
+    current_user = Depends(require_role("admin", "developer"))
+):
+    """Put failed webhook events back in the queue (e.g. after adding a status mapping)"""
+    replayed = await replay_failed_events(provider, event_id)
+    log_event("info", "webhook_replay", provider=provider, event_ids=event_id, replayed=replayed)
+    return {"replayed": replayed}
+
+# ------------------- Callpay Webhook Endpoint -------------------
 @router.post("/webhook", include_in_schema=False)
 async def webhook(request: Request):
+    """Store the notification in the webhook queue and acknowledge it straight away"""
     origin_ip = get_origin_ip(request)
 
     if origin_ip not in IP_WHITELIST:
@@ -88,144 +222,52 @@ async def webhook(request: Request):
         payload = await get_payload(request)
         log_event("info", "webhook_received", origin_ip=origin_ip, **payload)
 
-        try:
-            await push_to_loki("webhook_received", payload)
-        except Exception as e:
-            log_event("error", "loki_push_error", origin_ip=origin_ip, error=str(e))
-
-        merchant_reference = payload.get("merchant_reference")
-        status = payload.get("status")
-        reason = payload.get("reason")
-
-        if merchant_reference and status:
-            with db_session() as db:
-                success = update_order_status(db, merchant_reference, status, reason)
-                log_event("info", "payment_processed", origin_ip=origin_ip, status=status, success=success, merchant_reference=merchant_reference, reason=reason)
+        event_id = await enqueue_event(
+            "callpay",
+            payload,
+            event_id=callpay_event_id(payload),
+            event_type=payload.get("status"),
+            ordering_key=payload.get("merchant_reference"),
+            origin_ip=origin_ip
+        )
+        if event_id is None:
+            # Redelivery of an event we already have - acknowledge without queuing it again
+            log_event("info", "webhook_duplicate", origin_ip=origin_ip, provider_event_id=callpay_event_id(payload))
+            return JSONResponse({"status": "ok"})
+        log_event("info", "webhook_queued", origin_ip=origin_ip, event_id=event_id)
 
         return JSONResponse({"status": "ok"})
 
     except Exception as e:
+        # Not stored - a non-2xx makes Callpay deliver it again
         log_event("error", "webhook_error", origin_ip=origin_ip, error=str(e))
         raise HTTPException(status_code=500, detail="Internal server error")
 
 # ------------------Paypal Webhook Endpoint --------------
 @router.post("/webhook/paypal", include_in_schema=False)
 async def paypal_webhook(request: Request):
+    """Store the notification in the webhook queue and acknowledge it straight away"""
     origin_ip = get_origin_ip(request)
 
     try:
         payload = await request.json()
-        event_type = payload.get("event_type")
-        resource = payload.get("resource", {})
-
-        # Extract paypal_order_id from supplementary_data (for capture events)
-        paypal_order_id = None
-        if event_type == "PAYMENT.CAPTURE.COMPLETED":
-            supplementary_data = resource.get("supplementary_data", {})
-            related_ids = supplementary_data.get("related_ids", {})
-            paypal_order_id = related_ids.get("order_id")
-        
-        elif event_type == "CHECKOUT.ORDER.COMPLETED":
-            paypal_order_id = resource.get("id")
-
-        await push_to_loki("paypal_webhook", "paypal_webhook_received", {
-            "event_type": event_type,
-            "paypal_order_id": paypal_order_id,
-            "status": resource.get("status"),
-            "origin_ip": origin_ip
-        })
-
-        # Handle CHECKOUT.ORDER.COMPLETED event
-        if event_type == "CHECKOUT.ORDER.COMPLETED":
-            status = resource.get("status")
-
-            if paypal_order_id and status == "APPROVED":
-                with db_session() as db:
-                    order = db.query(Order).filter(Order.paypal_order_id == paypal_order_id).first()
-                    if order:
-                        order.status = "approved"
-                        order.reason = "PayPal approved - awaiting capture"
-                        order.updated_at = datetime.now(timezone.utc)
-                        db.commit()
-
-                        await push_to_loki("paypal_webhook", "paypal_order_approved", {
-                            "paypal_order_id": paypal_order_id,
-                            "status": status
-                        })
-
-                        log_event("info", "paypal_order_approved",
-                            paypal_order_id=paypal_order_id,
-                            status=status
-                        )
-
-        # Handle PAYMENT.CAPTURE.COMPLETED event
-        elif event_type == "PAYMENT.CAPTURE.COMPLETED":
-            status = resource.get("status")
-
-            if status == "COMPLETED" and paypal_order_id:
-                with db_session() as db:
-                    order = db.query(Order).filter(Order.paypal_order_id == paypal_order_id).first()
-                    if order:
-                        order.status = "completed"
-                        order.reason = "Payment captured successfully"
-                        order.updated_at = datetime.now(timezone.utc)
-                        db.commit()
-
-                        await push_to_loki("paypal_webhook", "paypal_payment_captured", {
-                            "paypal_order_id": paypal_order_id,
-                            "status": status
-                        })
-
-                        log_event("info", "paypal_payment_captured",
-                            paypal_order_id=paypal_order_id,
-                            status=status
-                        )
-
-        # Handle VAULT.PAYMENT-TOKEN.CREATED event
-        elif event_type == "VAULT.PAYMENT-TOKEN.CREATED":
-            vault_id = resource.get("id")
-            paypal_email = resource.get("payment_source", {}).get("paypal", {}).get("email_address")
-            
-            if vault_id and paypal_email:
-                result = save_paypal_vault_id(paypal_email, vault_id)
-
-                await push_to_loki("paypal_webhook", "vault_token_created", {
-                    "vault_id": vault_id,
-                    "paypal_email": paypal_email,
-                    "result": result
-                })
 
-        # Handle payment failures
-        elif event_type in ["PAYMENT.CAPTURE.DENIED", "PAYMENT.CAPTURE.REFUNDED"]:
-            reason = resource.get("status_details", {}).get("reason", "Unknown reason")
-
-            if paypal_order_id:
-                with db_session() as db:
-                    order = db.query(Order).filter(Order.paypal_order_id == paypal_order_id).first()
-                    if order:
-                        order.status = "failed"
-                        order.reason = f"PayPal: {event_type} - {reason}"
-                        order.updated_at = datetime.now(timezone.utc)
-                        db.commit()
-
-                        await push_to_loki("paypal_webhook", "paypal_payment_failed", {
-                            "paypal_order_id": paypal_order_id,
-                            "event_type": event_type,
-                            "reason": reason
-                        })
-
-                        log_event("error", "paypal_payment_failed",
-                            paypal_order_id=paypal_order_id,
-                            event_type=event_type,
-                            reason=reason
-                        )
+        event_id = await enqueue_event(
+            "paypal",
+            payload,
+            event_id=payload.get("id"),  # PayPal keeps the event id across retries
+            event_type=payload.get("event_type"),
+            ordering_key=paypal_order_id_of(payload),
+            origin_ip=origin_ip
+        )
+        if event_id is None:
+            log_event("info", "paypal_webhook_duplicate", origin_ip=origin_ip, provider_event_id=payload.get("id"))
+            return JSONResponse({"status": "ok"})
+        log_event("info", "paypal_webhook_queued", origin_ip=origin_ip, event_id=event_id, event_type=payload.get("event_type"))
 
         return JSONResponse({"status": "ok"})
 
     except Exception as e:
-        await push_to_loki("paypal_webhook", "paypal_webhook_error", {
-            "error": str(e),
-            "origin_ip": origin_ip
-        })
+        # Not stored - a non-2xx makes PayPal deliver it again
         log_event("error", "paypal_webhook_error", origin_ip=origin_ip, error=str(e))
-        raise HTTPException(status_code=500, detail="Internal server error")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail="Internal server error")